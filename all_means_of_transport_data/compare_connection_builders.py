@@ -0,0 +1,145 @@
+import io
+import json
+import argparse
+import pandas as pd
+from generate_connections_trips_ztm_zkm_skm import (
+    create_connections_by_trips,
+    create_connections_by_trips_skm,
+    create_connections_by_trips_vectorized,
+    create_trip_patterns,
+    fix_time_format,
+    serialize_patterns,
+    serialize_patterns_skm,
+    expand_patterns,
+)
+
+# Small fixture feed: two trips sharing a line number, a loop back to the first stop,
+# unsorted rows, non-zero seconds and a trip running past midnight whose departure
+# coincides with an early-morning trip of the same line
+FIXTURE_STOPS = """stop_id,stop_name,stop_lat,stop_lon
+101,Brama Wyżynna 01,54.350,18.645
+102,Dworzec Główny 01,54.356,18.644
+103,Hucisko 02,54.352,18.647
+104,Plac Solidarności 01,54.361,18.649
+105,Wały Jagiellońskie 02,54.353,18.651
+"""
+
+FIXTURE_STOP_TIMES = """trip_id,arrival_time,departure_time,stop_id,stop_sequence
+1_10_100,08:00:00,08:00:00,101,1
+1_10_100,08:04:30,08:05:00,103,3
+1_10_100,08:02:00,08:02:00,102,2
+1_10_100,08:09:00,08:09:00,104,4
+1_10_101,08:30:00,08:30:00,101,1
+1_10_101,08:32:00,08:32:00,102,2
+1_10_101,08:34:15,08:35:00,103,3
+1_12_200,23:55:00,23:55:00,104,1
+1_12_200,24:03:00,24:03:00,105,2
+1_12_200,24:10:00,24:11:00,101,3
+1_12_200,24:15:00,24:15:00,104,4
+1_12_201,23:10:00,23:10:00,104,1
+1_12_201,23:14:00,23:14:00,105,2
+1_12_202,00:03:00,00:03:00,105,1
+1_12_202,00:08:00,00:08:00,101,2
+1_10_102,09:00:00,09:00:00,101,1
+1_10_102,09:02:00,09:02:00,102,2
+"""
+
+
+def to_json(connections, skip_empty):
+    """Serializes a connections structure the way save_to_json/save_to_json_skm do."""
+    serialized = {}
+    for stop_id, data in connections.items():
+        trips = {
+            str(trip_id): {
+                'departure_times': trip_data['departure_times'],
+                'to_stations': {str(stop): time for stop, time in trip_data['to_stations'].items()}
+            }
+            for trip_id, trip_data in data['connections'].items()
+            if trip_data['to_stations'] or not skip_empty
+        }
+        if trips or not skip_empty:
+            serialized[str(stop_id)] = {
+                'stop_id': data['stop_id'],
+                'stop_name': data['stop_name'],
+                'lat': data['lat'],
+                'lon': data['lon'],
+                'connections': trips
+            }
+    return json.dumps(serialized, ensure_ascii=False, indent=4)
+
+
+def seconds_to_legacy_time(seconds):
+    """A departure in seconds as the row-by-row builders print it: "HH:MM:SS" wrapped by fix_time_format."""
+    return fix_time_format(f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}")
+
+
+def compare_with_legacy(expected, actual):
+    """
+    Compares the seconds-based output with a row-by-row builder. Departures must be equal after
+    wrapping; travel times must agree within the minute truncation of the old builders, except
+    on trips crossing midnight, where the old builders produced negative times.
+    """
+    expected, actual = json.loads(expected), json.loads(actual)
+    if expected.keys() != actual.keys():
+        return False, 0
+    midnight = 0
+    for stop_id, stop_data in expected.items():
+        if stop_data['connections'].keys() != actual[stop_id]['connections'].keys():
+            return False, midnight
+        for line_id, line_data in stop_data['connections'].items():
+            new_line = actual[stop_id]['connections'][line_id]
+            legacy_departures = list(dict.fromkeys(seconds_to_legacy_time(seconds) for seconds in new_line['departure_times']))
+            if legacy_departures != line_data['departure_times'] or line_data['to_stations'].keys() != new_line['to_stations'].keys():
+                return False, midnight
+            for next_stop, minutes in line_data['to_stations'].items():
+                seconds = new_line['to_stations'][next_stop]
+                if minutes < 0 and seconds >= 0:
+                    midnight += 1
+                elif abs(minutes * 60 - seconds) >= 60:
+                    return False, midnight
+    return True, midnight
+
+
+def compare(stops_df, stop_times_df):
+    """
+    Returns True when the vectorized builder agrees with both row-by-row builders and the
+    to_stations view of the saved trip patterns matches the vectorized builder byte for byte.
+    """
+    results = {}
+    for label, old_builder, trip_key, serializer, skip_empty in [
+        ("trip number (ZTM/ZKM)", create_connections_by_trips, 'default', serialize_patterns, False),
+        ("trip id (SKM/MZKW)", create_connections_by_trips_skm, None, serialize_patterns_skm, True),
+    ]:
+        expected = to_json(old_builder(stops_df, stop_times_df), skip_empty)
+        if trip_key is None:
+            vectorized = create_connections_by_trips_vectorized(stops_df, stop_times_df, trip_key=None)
+            patterns = create_trip_patterns(stops_df, stop_times_df, trip_key=None)
+        else:
+            vectorized = create_connections_by_trips_vectorized(stops_df, stop_times_df)
+            patterns = create_trip_patterns(stops_df, stop_times_df)
+        actual = to_json(vectorized, skip_empty)
+        saved_patterns = json.loads(json.dumps(serializer(patterns), ensure_ascii=False))
+
+        results[(label, "vectorized")], midnight = compare_with_legacy(expected, actual)
+        print(f"{label}, vectorized: {'OK' if results[(label, 'vectorized')] else 'MISMATCH'}"
+              f" ({midnight} travel time(s) across midnight fixed)")
+        results[(label, "trip patterns")] = actual == to_json(expand_patterns(saved_patterns), skip_empty)
+        print(f"{label}, trip patterns: {'OK' if results[(label, 'trip patterns')] else 'MISMATCH'}")
+    return all(results.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the vectorized connection builder with the row-by-row builders.")
+    parser.add_argument("--stops", help="stops.txt of a real feed (defaults to the built-in fixture)")
+    parser.add_argument("--stop-times", help="stop_times.txt of a real feed (defaults to the built-in fixture)")
+    args = parser.parse_args()
+
+    if args.stops and args.stop_times:
+        stops_df = pd.read_csv(args.stops)
+        stop_times_df = pd.read_csv(args.stop_times)
+    else:
+        stops_df = pd.read_csv(io.StringIO(FIXTURE_STOPS))
+        stop_times_df = pd.read_csv(io.StringIO(FIXTURE_STOP_TIMES))
+
+    if not compare(stops_df, stop_times_df):
+        raise SystemExit(1)
@@ -0,0 +1,126 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+# path points at the cached archive, changed is True only when its content differs from the previous fetch
+FeedResult = namedtuple('FeedResult', ['identifier', 'path', 'sha256', 'changed'])
+
+
+class FeedCache:
+    """
+    Content-addressed cache of GTFS archives: every archive is stored once as objects/<sha256>.zip
+    and index.json remembers, per feed, the current hash together with the ETag/Last-Modified
+    validators used for conditional requests.
+    """
+
+    def __init__(self, cache_directory, timeout=60):
+        self.cache_directory = cache_directory
+        self.objects_directory = os.path.join(cache_directory, 'objects')
+        self.index_file = os.path.join(cache_directory, 'index.json')
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        os.makedirs(self.objects_directory, exist_ok=True)
+        if os.path.exists(self.index_file):
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+        else:
+            self.index = {}
+
+    def object_path(self, sha256):
+        return os.path.join(self.objects_directory, f"{sha256}.zip")
+
+    def _cached_result(self, identifier, entry):
+        if entry and os.path.exists(self.object_path(entry['sha256'])):
+            return FeedResult(identifier, self.object_path(entry['sha256']), entry['sha256'], False)
+        return None
+
+    def fetch(self, identifier, url):
+        with self._lock:
+            entry = self.index.get(identifier)
+        cached = self._cached_result(identifier, entry)
+
+        headers = {'User-Agent': 'Mozilla/5.0'}
+        if cached and entry.get('url') == url:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        try:
+            logging.info(f"Fetching GTFS data for {identifier} from {url}")
+            with requests.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                if response.status_code == 304 and cached:
+                    logging.info(f"{identifier}: not modified")
+                    return cached
+                response.raise_for_status()
+
+                digest = hashlib.sha256()
+                with tempfile.NamedTemporaryFile(dir=self.objects_directory, suffix='.part', delete=False) as f:
+                    for block in response.iter_content(chunk_size=1 << 20):
+                        digest.update(block)
+                        f.write(block)
+                    temporary_file = f.name
+                sha256 = digest.hexdigest()
+
+                if os.path.exists(self.object_path(sha256)):
+                    os.remove(temporary_file)
+                else:
+                    os.replace(temporary_file, self.object_path(sha256))
+
+                with self._lock:
+                    self.index[identifier] = {
+                        'url': url,
+                        'sha256': sha256,
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified'),
+                    }
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Error downloading data for {identifier}: {e}")
+            return cached
+
+        changed = not cached or cached.sha256 != sha256
+        logging.info(f"{identifier}: {'new content' if changed else 'content unchanged'} ({sha256[:12]})")
+        return FeedResult(identifier, self.object_path(sha256), sha256, changed)
+
+    def fetch_all(self, sources, max_workers=4):
+        """Fetches {identifier: url} concurrently; feeds that could not be fetched at all are left out."""
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {identifier: executor.submit(self.fetch, identifier, url) for identifier, url in sources.items()}
+            results = {identifier: future.result() for identifier, future in futures.items()}
+        self.save_index()
+        self.prune()
+        return {identifier: result for identifier, result in results.items() if result is not None}
+
+    def save_index(self):
+        with self._lock:
+            with open(self.index_file, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, indent=4)
+
+    def prune(self):
+        """Removes archives no longer referenced by any feed."""
+        referenced = {f"{entry['sha256']}.zip" for entry in self.index.values()}
+        for name in os.listdir(self.objects_directory):
+            if name not in referenced:
+                os.remove(os.path.join(self.objects_directory, name))
+
+    def export(self, result, destination):
+        """Copies a cached archive to destination unless it already holds the same content; returns True if copied."""
+        if os.path.exists(destination) and file_sha256(destination) == result.sha256:
+            return False
+        shutil.copyfile(result.path, destination)
+        return True
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
@@ -1,11 +1,23 @@
 import pandas as pd
+import numpy as np
 import json
+import hashlib
 from collections import defaultdict
 from tqdm import tqdm
 import requests
 import zipfile
 import os
+import time
+from datetime import datetime, timedelta
 import logging
+import sys
+import argparse
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from feed_cache import FeedCache, file_sha256
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from trip_patterns import pattern_id, pattern_to_stations, expand_patterns, drop_unused_patterns, namespaced_id
 
 logging.basicConfig(level=logging.INFO)
 
@@ -16,92 +28,144 @@ gtfs_sources = {
     "skm": "https://www.skm.pkp.pl/gtfs-mi-kpd.zip",
     "mzkw": "https://mkuran.pl/gtfs/wejherowo.zip"
 }
-def clear_folder(folder_path):
-    if os.path.exists(folder_path):
-        for root, dirs, files in os.walk(folder_path, topdown=False):
-            for name in files:
-                os.remove(os.path.join(root, name))
-            for name in dirs:
-                os.rmdir(os.path.join(root, name))
-        os.rmdir(folder_path)
-        logging.info(f"Cleared existing folder: {folder_path}")
-
-def download_and_extract_files(identifier, url):
+def archive_path(gtfs_directory, identifier):
+    return os.path.join(gtfs_directory, f"{identifier}.zip")
+
+def extract_stops_file(zip_path, identifier, gtfs_directory):
+    """Copies stops.txt out of the archive for stops_list.py; the other tables are read from the zip directly."""
     try:
-        logging.info(f"Downloading GTFS data for {identifier} from {url}")
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-
-        # Temporary ZIP file name
-        zip_filename = f"{identifier}_gtfs_data.zip"
-        with open(zip_filename, 'wb') as f:
-            f.write(response.content)
-        logging.info(f"Downloaded {identifier} data: {zip_filename}")
-
-        # Extract ZIP file
-        with zipfile.ZipFile(zip_filename, 'r') as zip_ref:
-            extract_folder = f"{identifier}_gtfs_data"
-            os.makedirs(extract_folder, exist_ok=True)
-            zip_ref.extractall(extract_folder)
-            logging.info(f"Extracted {identifier} data to {extract_folder}")
-
-            # Find and copy stops.txt to gtfs_data folder
-            stops_file = os.path.join(extract_folder, "stops.txt")
-            if os.path.exists(stops_file):
-                new_stops_file = os.path.join(gtfs_data_folder, f"stops_{identifier}.txt")
-                os.rename(stops_file, new_stops_file)
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            if "stops.txt" in zip_ref.namelist():
+                new_stops_file = os.path.join(gtfs_directory, f"stops_{identifier}.txt")
+                with zip_ref.open("stops.txt") as source, open(new_stops_file, 'wb') as target:
+                    target.write(source.read())
                 logging.info(f"Saved stops.txt as {new_stops_file}")
             else:
                 logging.warning(f"stops.txt not found for {identifier}")
-
-            # Find and copy stoptimes.txt to gtfs_data folder
-            stoptimes_file = os.path.join(extract_folder, "stop_times.txt")
-            if os.path.exists(stoptimes_file):
-                new_stoptimes_file = os.path.join(gtfs_data_folder, f"stoptimes_{identifier}.txt")
-                os.rename(stoptimes_file, new_stoptimes_file)
-                logging.info(f"Saved stop_times.txt as {new_stoptimes_file}")
-            else:
+            if "stop_times.txt" not in zip_ref.namelist():
                 logging.warning(f"stop_times.txt not found for {identifier}")
-
-        # Clean up temporary files
-        os.remove(zip_filename)
-        logging.info(f"Deleted zip file: {zip_filename}")
-
-        # Optionally, remove the extracted folder
-        for root, dirs, files in os.walk(extract_folder, topdown=False):
-            for name in files:
-                os.remove(os.path.join(root, name))
-            for name in dirs:
-                os.rmdir(os.path.join(root, name))
-        os.rmdir(extract_folder)
-        logging.info(f"Deleted extracted folder: {extract_folder}")
-
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error downloading data for {identifier}: {e}")
     except zipfile.BadZipFile as e:
-        logging.error(f"Error extracting zip file for {identifier}: {e}")
-
-def check_existing_files():
-    if not os.path.exists(gtfs_data_folder):
-        return False
-    for identifier in gtfs_sources.keys():
-        stops_file = os.path.join(gtfs_data_folder, f"stops_{identifier}.txt")
-        stoptimes_file = os.path.join(gtfs_data_folder, f"stoptimes_{identifier}.txt")
-        if not (os.path.exists(stops_file) and os.path.exists(stoptimes_file)):
-            return False
-    return True
-# Function to load GTFS data from stops.txt and stop_times.txt
-def load_gtfs_data(gtfs_directory):
-    ztm_stops_df = pd.read_csv(f'{gtfs_directory}/stops_ztm.txt')
-    ztm_stop_times_df = pd.read_csv(f'{gtfs_directory}/stoptimes_ztm.txt')
-    zkm_stops_df = pd.read_csv(f'{gtfs_directory}/stops_zkm.txt')
-    zkm_stop_times_df = pd.read_csv(f'{gtfs_directory}/stoptimes_zkm.txt')
-    skm_stops_df = pd.read_csv(f'{gtfs_directory}/stops_skm.txt')
-    skm_stop_times_df = pd.read_csv(f'{gtfs_directory}/stoptimes_skm.txt')
-    mzkw_stops_df = pd.read_csv(f'{gtfs_directory}/stops_mzkw.txt')
-    mzkw_stop_times_df = pd.read_csv(f'{gtfs_directory}/stoptimes_mzkw.txt')
-    return ztm_stops_df, ztm_stop_times_df, zkm_stops_df, zkm_stop_times_df, skm_stops_df, skm_stop_times_df, mzkw_stops_df, mzkw_stop_times_df
+        logging.error(f"Error reading zip file for {identifier}: {e}")
+
+# Columns read from stop_times.txt; the remaining GTFS columns are never loaded
+stop_times_columns = ['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence']
+
+def read_gtfs_member(zip_path, member, **read_csv_kwargs):
+    """Reads one GTFS table directly from the archive."""
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        with zip_ref.open(member) as f:
+            return pd.read_csv(f, **read_csv_kwargs)
+
+def time_to_seconds(times):
+    """Converts a Series of "HH:MM:SS" GTFS times (hours may exceed 24) to int32 seconds."""
+    parts = times.astype(str).str.strip().str.split(':', expand=True).astype(np.int32)
+    return (parts[0] * 3600 + parts[1] * 60 + parts[2]).astype(np.int32)
+
+def compact_stop_ids(stop_ids):
+    """int32 when every stop_id of the feed is numeric, categorical otherwise."""
+    numeric = pd.to_numeric(stop_ids, errors='coerce')
+    if numeric.notna().all() and (numeric % 1 == 0).all():
+        return numeric.astype(np.int32)
+    return stop_ids.astype(str).astype('category')
+
+def iter_stop_times(zip_path, numeric_stop_ids=True, chunksize=500_000):
+    """
+    Streams stop_times.txt from the archive in chunks with compact dtypes: categorical trip_id,
+    int32 stop_id (or categorical), int32 stop_sequence and int32 seconds for both times.
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        with zip_ref.open("stop_times.txt") as f:
+            for chunk in pd.read_csv(f, usecols=stop_times_columns, dtype=str, chunksize=chunksize):
+                yield pd.DataFrame({
+                    'trip_id': chunk['trip_id'].astype('category'),
+                    'arrival_time': time_to_seconds(chunk['arrival_time']),
+                    'departure_time': time_to_seconds(chunk['departure_time']),
+                    'stop_id': chunk['stop_id'].astype(np.int32) if numeric_stop_ids else chunk['stop_id'].astype('category'),
+                    'stop_sequence': chunk['stop_sequence'].astype(np.int32),
+                })
+
+def load_feed_from_archive(zip_path, chunksize=500_000):
+    stops_df = read_gtfs_member(zip_path, "stops.txt", usecols=['stop_id', 'stop_name', 'stop_lat', 'stop_lon'],
+                                dtype={'stop_id': str, 'stop_name': str, 'stop_lat': np.float64, 'stop_lon': np.float64})
+    stops_df['stop_id'] = compact_stop_ids(stops_df['stop_id'])
+    numeric_stop_ids = pd.api.types.is_integer_dtype(stops_df['stop_id'])
+
+    chunks = list(iter_stop_times(zip_path, numeric_stop_ids, chunksize))
+    stop_times_df = pd.concat(chunks, ignore_index=True)
+    # Categories differ between chunks, so the categorical columns are unioned explicitly
+    for column in ['trip_id'] + ([] if numeric_stop_ids else ['stop_id']):
+        stop_times_df[column] = pd.api.types.union_categoricals([chunk[column] for chunk in chunks])
+    return stops_df, stop_times_df
+
+def load_trip_services(gtfs_directory, identifier):
+    """Maps trip_id to '<identifier>:<service_id>'; None when the feed has no archive or no trips.txt."""
+    zip_path = archive_path(gtfs_directory, identifier)
+    if not os.path.exists(zip_path):
+        return None
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        if "trips.txt" not in zip_ref.namelist():
+            return None
+    trips = read_gtfs_member(zip_path, "trips.txt", usecols=['trip_id', 'service_id'], dtype=str)
+    return {trip_id: f"{identifier}:{service_id}" for trip_id, service_id in zip(trips['trip_id'], trips['service_id'])}
+
+def load_line_route_types(gtfs_directory, identifier):
+    """
+    Maps the line keys of a feed (see feed_trip_keys) to the GTFS route_type of their first trip;
+    empty when the feed has no trips.txt or routes.txt (modes.line_mode_bits falls back to the operator).
+    """
+    zip_path = archive_path(gtfs_directory, identifier)
+    if not os.path.exists(zip_path):
+        return {}
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        if not {"trips.txt", "routes.txt"} <= set(zip_ref.namelist()):
+            return {}
+    trips = read_gtfs_member(zip_path, "trips.txt", usecols=['trip_id', 'route_id'], dtype=str)
+    routes = read_gtfs_member(zip_path, "routes.txt", usecols=['route_id', 'route_type'], dtype=str)
+    route_types = dict(zip(routes['route_id'], routes['route_type'].astype(int)))
+    trip_key = feed_trip_keys[identifier]
+    line_route_types = {}
+    for trip_id, route_id in zip(trips['trip_id'], trips['route_id']):
+        if route_id in route_types:
+            line_route_types.setdefault(str(trip_key(trip_id) if trip_key else trip_id), route_types[route_id])
+    return line_route_types
+
+def load_service_calendar(gtfs_directory, identifier):
+    """
+    Maps '<identifier>:<service_id>' to the sorted dates (YYYYMMDD) the service runs on,
+    from calendar.txt weekday ranges adjusted by calendar_dates.txt exceptions.
+    """
+    zip_path = archive_path(gtfs_directory, identifier)
+    if not os.path.exists(zip_path):
+        return {}
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        members = set(zip_ref.namelist())
+
+    service_dates = defaultdict(set)
+    if "calendar.txt" in members:
+        weekdays = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+        for service in read_gtfs_member(zip_path, "calendar.txt", dtype=str).to_dict('records'):
+            day = datetime.strptime(service['start_date'].strip(), '%Y%m%d').date()
+            end = datetime.strptime(service['end_date'].strip(), '%Y%m%d').date()
+            active = [service[weekday].strip() == '1' for weekday in weekdays]
+            while day <= end:
+                if active[day.weekday()]:
+                    service_dates[service['service_id']].add(day.strftime('%Y%m%d'))
+                day += timedelta(days=1)
+    if "calendar_dates.txt" in members:
+        for exception in read_gtfs_member(zip_path, "calendar_dates.txt", dtype=str).to_dict('records'):
+            if exception['exception_type'].strip() == '1':
+                service_dates[exception['service_id']].add(exception['date'].strip())
+            else:
+                service_dates[exception['service_id']].discard(exception['date'].strip())
+
+    return {f"{identifier}:{service_id}": sorted(dates) for service_id, dates in service_dates.items()}
+
+# Function to load stops and stop_times of a single feed from its downloaded archive
+def load_feed(gtfs_directory, identifier):
+    zip_path = archive_path(gtfs_directory, identifier)
+    if not os.path.exists(zip_path):
+        raise FileNotFoundError(f"GTFS archive for {identifier} not found at {zip_path}; download the feeds first")
+    return load_feed_from_archive(zip_path)
 
 # Function to convert 24-hour format times like "25:02:00" to "01:02:00"
 def fix_time_format(time_str):
@@ -272,19 +336,179 @@ def create_connections_by_trips_skm(stops_df, stop_times_df):
 
 
     return connections
+
+def _time_seconds(times):
+    """Seconds since the start of the service day (25:02:00 -> 90120), from "HH:MM:SS" strings or int seconds."""
+    if pd.api.types.is_integer_dtype(times):
+        return times.to_numpy().astype(np.int64)
+    return time_to_seconds(times).to_numpy().astype(np.int64)
+
+def create_connections_by_trips_vectorized(stops_df, stop_times_df, trip_key=extract_trip_number, trip_services=None):
+    """
+    Builds the structure of create_connections_by_trips (trip_key=extract_trip_number)
+    or create_connections_by_trips_skm (trip_key=None) without per-stop filtering.
+
+    stop_times is sorted once by (trip_id, stop_sequence); for every (stop, line) pair the
+    first stop_time row in file order defines the downstream to_stations, exactly as in the
+    row-by-row builders. Unlike them, departure_times and travel times are integer seconds
+    since the start of the service day, so departures after midnight stay after the evening ones.
+
+    With trip_services ({trip_id: service key}, see load_trip_services) every line also gets
+    'departure_services', parallel to 'departure_times': the services of the trips leaving
+    at that time, an empty list meaning the departure runs every day.
+    """
+    return expand_patterns(create_trip_patterns(stops_df, stop_times_df, trip_key, trip_services))
+
+def create_trip_patterns(stops_df, stop_times_df, trip_key=extract_trip_number, trip_services=None):
+    """
+    The connections of create_connections_by_trips_vectorized in the trip-pattern layout of
+    src/trip_patterns.py: every stop sequence is stored once and each (stop, line) pair refers
+    to its position in it instead of holding the whole downstream to_stations dictionary.
+    """
+    data, _ = _patterns_with_row_order(stops_df, stop_times_df, trip_key, trip_services)
+    return data
+
+def _patterns_with_row_order(stops_df, stop_times_df, trip_key, trip_services=None):
+    """
+    Vectorized builder returning the trip patterns together with the stop_times index label of
+    the first row of every stop and every (stop, line) pair, which is what merge_connection_shards
+    needs to restore the serial ordering.
+    """
+    stop_times = stop_times_df[['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence']]
+    row_count = len(stop_times)
+
+    stop_codes, stop_ids = pd.factorize(stop_times['stop_id'])
+    trip_codes, trip_ids = pd.factorize(stop_times['trip_id'])
+    if trip_key is None:
+        line_codes = trip_codes
+        line_keys = list(trip_ids)
+    else:
+        line_code_by_trip, line_keys = pd.factorize(pd.Series([trip_key(trip_id) for trip_id in trip_ids], dtype=object))
+        line_codes = line_code_by_trip[trip_codes]
+        line_keys = list(line_keys)
+    stop_sequence = stop_times['stop_sequence'].to_numpy()
+
+    departure_seconds = _time_seconds(stop_times['departure_time'])
+    arrival_seconds = _time_seconds(stop_times['arrival_time'])
+    departure_codes, departure_values = pd.factorize(departure_seconds)
+    departure_values = departure_values.tolist()
+
+    # Sort once by (trip, stop_sequence); file order breaks ties
+    rows = np.arange(row_count)
+    order = np.lexsort((rows, stop_sequence, trip_codes))
+    position = np.empty(row_count, dtype=np.int64)
+    position[order] = rows
+    sorted_trips = trip_codes[order]
+    sorted_sequence = stop_sequence[order]
+
+    # For every sorted position: end of its trip and first position with a greater stop_sequence
+    trip_change = np.flatnonzero(np.diff(sorted_trips)) + 1
+    trip_ends = np.append(trip_change, row_count)
+    trip_end = np.repeat(trip_ends, np.diff(np.concatenate(([0], trip_ends))))
+    run_change = np.flatnonzero((np.diff(sorted_trips) != 0) | (np.diff(sorted_sequence) != 0)) + 1
+    run_ends = np.append(run_change, row_count)
+    next_greater = np.repeat(run_ends, np.diff(np.concatenate(([0], run_ends))))
+
+    # The first row of every (stop, line) pair defines its to_stations
+    pair = stop_codes.astype(np.int64) * max(len(line_keys), 1) + line_codes
+    _, defining_rows = np.unique(pair, return_index=True)
+    defining_rows = defining_rows[np.lexsort((defining_rows, stop_codes[defining_rows]))]
+
+    # Each trip defining a (stop, line) pair contributes its whole stop sequence as a pattern,
+    # with times relative to its first departure; identical sequences share one pattern
+    trip_start = np.repeat(np.concatenate(([0], trip_change)), np.diff(np.concatenate(([0], trip_ends))))
+    patterns = {}
+    pattern_by_trip = {}
+    pattern_trips = np.unique(trip_codes[defining_rows])
+    for trip_code, first in zip(pattern_trips.tolist(), np.searchsorted(sorted_trips, pattern_trips).tolist()):
+        rows_of_trip = order[first:trip_end[first]]
+        first_departure = departure_seconds[rows_of_trip[0]]
+        pattern_stops = [str(stop_id) for stop_id in stop_ids[stop_codes[rows_of_trip]]]
+        arrivals = (arrival_seconds[rows_of_trip] - first_departure).tolist()
+        departures = (departure_seconds[rows_of_trip] - first_departure).tolist()
+        key = pattern_id(pattern_stops, arrivals, departures)
+        patterns.setdefault(key, {'stops': pattern_stops, 'arrivals': arrivals, 'departures': departures})
+        pattern_by_trip[trip_code] = key
+    pattern_positions = (position[defining_rows] - trip_start[position[defining_rows]]).tolist()
+    next_positions = (next_greater[position[defining_rows]] - trip_start[position[defining_rows]]).tolist()
+
+    # Unique departures per (stop, line) pair, in file order
+    unique_departures = pd.DataFrame({'pair': pair, 'departure': departure_codes}).drop_duplicates()
+    departures_by_pair = defaultdict(list)
+    for pair_id, departure_code in zip(unique_departures['pair'].tolist(), unique_departures['departure'].tolist()):
+        departures_by_pair[pair_id].append(departure_code)
+
+    services_by_departure = None
+    if trip_services is not None:
+        service_code_by_trip, service_keys = pd.factorize(pd.Series([trip_services.get(str(trip_id)) for trip_id in trip_ids], dtype=object))
+        unique_services = pd.DataFrame({
+            'pair': pair, 'departure': departure_codes, 'service': service_code_by_trip[trip_codes]
+        }).drop_duplicates()
+        services_by_departure = defaultdict(set)
+        runs_every_day = set()
+        for pair_id, departure_code, service_code in zip(unique_services['pair'].tolist(), unique_services['departure'].tolist(),
+                                                         unique_services['service'].tolist()):
+            if service_code < 0:
+                runs_every_day.add((pair_id, departure_code))
+            else:
+                services_by_departure[(pair_id, departure_code)].add(service_keys[service_code])
+        for key in runs_every_day:
+            services_by_departure[key] = set()
+
+    stops_info = {
+        stop_id: (stop_name, stop_lat, stop_lon)
+        for stop_id, stop_name, stop_lat, stop_lon in zip(
+            stops_df['stop_id'], stops_df['stop_name'], stops_df['stop_lat'], stops_df['stop_lon'])
+    }
+
+    row_labels = stop_times_df.index.to_numpy()[defining_rows].tolist()
+    connections = {}
+    row_order = {}
+    for index, row in enumerate(defining_rows.tolist()):
+        current_stop_id = stop_ids[stop_codes[row]]
+        line_key = line_keys[line_codes[row]]
+        if current_stop_id not in row_order:
+            row_order[current_stop_id] = (row_labels[index], {})
+        row_order[current_stop_id][1][line_key] = row_labels[index]
+        if current_stop_id not in connections:
+            stop_name, stop_lat, stop_lon = stops_info[current_stop_id]
+            connections[current_stop_id] = {
+                # Numeric ids stay ints as in the old files; compact_stop_ids keeps others (e.g. MZKW 'W1') as strings
+                'stop_id': int(current_stop_id) if isinstance(current_stop_id, (int, np.integer)) else str(current_stop_id),
+                'stop_name': stop_name,
+                'lat': float(stop_lat),
+                'lon': float(stop_lon),
+                'connections': {}
+            }
+        departures = departures_by_pair[pair[row]]
+        line_data = {'departure_times': [departure_values[departure_code] for departure_code in departures]}
+        if services_by_departure is not None:
+            line_data['departure_services'] = [
+                sorted(services_by_departure[(pair[row], departure_code)]) for departure_code in departures
+            ]
+        line_data['pattern'] = pattern_by_trip[trip_codes[row]]
+        line_data['position'] = pattern_positions[index]
+        if next_positions[index] != pattern_positions[index] + 1:
+            line_data['next'] = next_positions[index]
+        connections[current_stop_id]['connections'][line_key] = line_data
+
+    return {'stops': connections, 'patterns': patterns}, row_order
 # Function to save connections to JSON file
-def save_to_json(connections, output_file):
+def serialize_connections(connections):
     connections = {str(k): dict(v) for k, v in connections.items()}
     for stop_id, data in connections.items():
         data['connections'] = {str(trip_id): {
             'departure_times': trip_data['departure_times'],
-            'to_stations': {str(stop): time for stop, time in trip_data['to_stations'].items()}
+            'to_stations': {str(stop): time for stop, time in trip_data['to_stations'].items()},
+            **({'departure_services': trip_data['departure_services']} if 'departure_services' in trip_data else {})
         } for trip_id, trip_data in data['connections'].items()}
+    return connections
 
+def save_to_json(connections, output_file):
     with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(connections, f, ensure_ascii=False, indent=4)
+        json.dump(serialize_connections(connections), f, ensure_ascii=False, indent=4)
 
-def save_to_json_skm(connections, output_file):
+def serialize_connections_skm(connections):
     # Convert defaultdict to a regular dict for JSON serialization
     filtered_connections = {}
 
@@ -305,86 +529,351 @@ def save_to_json_skm(connections, output_file):
                 'lon': data['lon'],
                 'connections': filtered_trips
             }
+    return filtered_connections
 
+def save_to_json_skm(connections, output_file):
     # Write the filtered connections data to a JSON file
     with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(filtered_connections, f, ensure_ascii=False, indent=4)
-def merge_json_files(input_files, output_file):
-    merged_data = {}
+        json.dump(serialize_connections_skm(connections), f, ensure_ascii=False, indent=4)
+
+def serialize_patterns(data):
+    return {
+        'stops': {str(stop_id): dict(stop_data, connections={str(line_id): line_data for line_id, line_data in stop_data['connections'].items()})
+                  for stop_id, stop_data in data['stops'].items()},
+        # Sorted by id, so sharded and serial builds write the same file
+        'patterns': dict(sorted(data['patterns'].items()))
+    }
 
-    # Wczytywanie i łączenie zawartości każdego pliku JSON
-    for file_path in input_files:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            # Dodawanie zawartości do głównego słownika
-            merged_data.update(data)
-    
-    # Zapisanie połączonych danych do nowego pliku JSON
+def serialize_patterns_skm(data):
+    # Same filtering as serialize_connections_skm: lines without any next stop and stops without lines are dropped
+    data = serialize_patterns(data)
+    for stop_id in list(data['stops']):
+        connections = {
+            line_id: line_data for line_id, line_data in data['stops'][stop_id]['connections'].items()
+            if pattern_to_stations(data['patterns'][line_data['pattern']], line_data['position'], line_data.get('next'))
+        }
+        if connections:
+            data['stops'][stop_id]['connections'] = connections
+        else:
+            del data['stops'][stop_id]
+    return drop_unused_patterns(data)
+
+# Pattern files are read by programs only, so they are written without indentation
+def save_patterns_to_json(data, output_file):
     with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(merged_data, f, ensure_ascii=False, indent=4)
+        json.dump(serialize_patterns(data), f, ensure_ascii=False, separators=(',', ':'))
 
+def save_patterns_to_json_skm(data, output_file):
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(serialize_patterns_skm(data), f, ensure_ascii=False, separators=(',', ':'))
 
-# Main part of the program
-if __name__ == "__main__":
-    gtfs_data_folder = "gtfs_data"
-    ztm_output_file = 'ztm_connections_by_trips.json'
-    zkm_output_file = 'zkm_connections_by_trips.json'
-    skm_output_file = 'skm_connections_by_trips.json'
-    mzkw_output_file = 'mzkw_connections_by_trips.json'
-        # Check if data already exists and is complete
-    if check_existing_files():
-        logging.info("All required GTFS files already exist. Skipping download.")
-    else:
-        logging.info("GTFS data is incomplete or missing. Downloading...")
-        if os.path.exists(gtfs_data_folder):
-            clear_folder(gtfs_data_folder)
-        os.makedirs(gtfs_data_folder, exist_ok=True)
+# Builder settings per feed: how trips are grouped into lines and how the result is saved
+feed_trip_keys = {"ztm": extract_trip_number, "zkm": extract_trip_number, "skm": None, "mzkw": None}
+feed_savers = {"ztm": save_patterns_to_json, "zkm": save_patterns_to_json, "skm": save_patterns_to_json_skm, "mzkw": save_patterns_to_json_skm}
+feed_serializers = {"ztm": serialize_patterns, "zkm": serialize_patterns, "skm": serialize_patterns_skm, "mzkw": serialize_patterns_skm}
 
-        # Process each GTFS source
-        for identifier, url in gtfs_sources.items():
-            download_and_extract_files(identifier, url)
+# Feeds large enough to be split into trip-range shards in the parallel build
+sharded_feeds = {"ztm"}
 
-    # 1. Load data from GTFS sources
-    ztm_stops_df, ztm_stop_times_df, zkm_stops_df, zkm_stop_times_df, skm_stops_df, skm_stop_times_df, mzkw_stops_df, mzkw_stop_times_df = load_gtfs_data(gtfs_data_folder)
+def shard_stop_times(stop_times_df, trip_key, shard_index, shard_count):
+    """Keeps the rows of one contiguous range of line keys, so every line is built by a single shard."""
+    line_by_trip = {
+        trip_id: str(trip_key(trip_id) if trip_key else trip_id)
+        for trip_id in stop_times_df['trip_id'].unique()
+    }
+    line_keys = sorted(set(line_by_trip.values()))
+    bounds = np.linspace(0, len(line_keys), shard_count + 1).astype(int)
+    shard_lines = set(line_keys[bounds[shard_index]:bounds[shard_index + 1]])
+    shard_trips = [trip_id for trip_id, line_key in line_by_trip.items() if line_key in shard_lines]
+    return stop_times_df[stop_times_df['trip_id'].isin(shard_trips)]
+
+def build_feed_shard(gtfs_directory, identifier, shard_index=0, shard_count=1):
+    started = time.perf_counter()
+    stops_df, stop_times_df = load_feed(gtfs_directory, identifier)
+    trip_key = feed_trip_keys[identifier]
+    if shard_count > 1:
+        stop_times_df = shard_stop_times(stop_times_df, trip_key, shard_index, shard_count)
+    data, row_order = _patterns_with_row_order(stops_df, stop_times_df, trip_key,
+                                               load_trip_services(gtfs_directory, identifier))
+    return data, row_order, time.perf_counter() - started
+
+def merge_connection_shards(shards):
+    """Merges (patterns data, row_order) shard results back into the order of a serial build."""
+    stop_rows = {}
+    stop_data = {}
+    line_entries = defaultdict(list)
+    patterns = {}
+    for data, row_order in shards:
+        connections = data['stops']
+        patterns.update(data['patterns'])
+        for stop_id, (stop_row, line_rows) in row_order.items():
+            stop_rows[stop_id] = min(stop_row, stop_rows.get(stop_id, stop_row))
+            stop_data.setdefault(stop_id, connections[stop_id])
+            for line_key, line_row in line_rows.items():
+                line_entries[stop_id].append((line_row, line_key, connections[stop_id]['connections'][line_key]))
+
+    merged = {}
+    for stop_id in sorted(stop_rows, key=stop_rows.get):
+        merged[stop_id] = dict(stop_data[stop_id], connections={})
+        for _, line_key, line_data in sorted(line_entries[stop_id], key=lambda entry: entry[0]):
+            merged[stop_id]['connections'][line_key] = line_data
+    return {'stops': merged, 'patterns': patterns}
+
+def build_feeds_parallel(gtfs_directory, output_files, workers, shard_count):
+    """
+    Builds every feed of output_files on a process pool. Feeds in sharded_feeds are split
+    into shard_count trip-range shards; the saved files match the serial build byte for byte.
+    """
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for identifier in output_files:
+            shards = shard_count if identifier in sharded_feeds else 1
+            futures[identifier] = [
+                executor.submit(build_feed_shard, gtfs_directory, identifier, shard_index, shards)
+                for shard_index in range(shards)
+            ]
+
+        for identifier, output_file in output_files.items():
+            results = [future.result() for future in futures[identifier]]
+            if len(results) == 1:
+                connections = results[0][0]
+            else:
+                connections = merge_connection_shards([(shard, row_order) for shard, row_order, _ in results])
+            feed_savers[identifier](connections, output_file)
+            worker_time = sum(elapsed for _, _, elapsed in results)
+            logging.info(f"{identifier.upper()}: {len(results)} shard(s), slowest shard {max(elapsed for _, _, elapsed in results):.1f}s, "
+                         f"{worker_time:.1f}s worker time, saved to {output_file} after {time.perf_counter() - started:.1f}s")
+
+def manifest_path(output_file):
+    return output_file.replace('.json', '_manifest.json')
+
+def source_path(output_file):
+    return output_file.replace('.json', '_source.json')
+
+def load_source_hashes(output_file):
+    """{feed identifier: SHA-256 of its GTFS archive} of the archives output_file was built from."""
+    if not os.path.exists(source_path(output_file)):
+        return {}
+    with open(source_path(output_file), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_source_hashes(source_hashes, output_file):
+    with open(source_path(output_file), 'w', encoding='utf-8') as f:
+        json.dump(source_hashes, f, indent=4)
+
+def compute_trip_manifest(stop_times_df, trip_services=None):
+    """Maps every trip_id to [content hash of its stop_times rows and service, stop ids the trip visits]."""
+    stop_times = stop_times_df.sort_values(['trip_id', 'stop_sequence'], kind='stable')
+    trip_services = trip_services or {}
+    trip_rows = pd.DataFrame({
+        'trip_id': stop_times['trip_id'].astype(str),
+        'stop_id': stop_times['stop_id'].astype(str),
+        'row': stop_times['stop_id'].astype(str) + ',' + stop_times['arrival_time'].astype(str) + ','
+               + stop_times['departure_time'].astype(str) + ',' + stop_times['stop_sequence'].astype(str)
+    }).groupby('trip_id', sort=False).agg({'row': '\n'.join, 'stop_id': list})
+
+    return {
+        trip_id: [hashlib.sha1(f"{trip_services.get(trip_id)}\n{rows}".encode('utf-8')).hexdigest(), sorted(set(stop_ids))]
+        for trip_id, rows, stop_ids in zip(trip_rows.index, trip_rows['row'], trip_rows['stop_id'])
+    }
 
-    # Process ZTM
-    if os.path.exists(ztm_output_file):
-        logging.info("ZTM JSON file already exists. Skipping ZTM processing.")
-    else:
-        ztm_connections_by_trips = create_connections_by_trips(ztm_stops_df, ztm_stop_times_df)
-        save_to_json(ztm_connections_by_trips, ztm_output_file)
-        print(f"ZTM connections saved to {ztm_output_file}")
+def save_trip_manifest(manifest, manifest_file):
+    with open(manifest_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+
+def update_feed_incrementally(identifier, stops_df, stop_times_df, output_file, manifest_file, trip_services=None):
+    """
+    Patches an existing connections file with the changes since the build recorded in manifest_file.
+    Only stops visited by trips that were added, removed or changed are rebuilt; each is rebuilt
+    from every trip passing through it, so its entry is the same as in a full build.
+    """
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        old_manifest = json.load(f)
+    new_manifest = compute_trip_manifest(stop_times_df, trip_services)
+
+    changed_trips = [
+        trip_id for trip_id in old_manifest.keys() | new_manifest.keys()
+        if old_manifest.get(trip_id, [None])[0] != new_manifest.get(trip_id, [None])[0]
+    ]
+    affected_stops = set()
+    for trip_id in changed_trips:
+        affected_stops.update(old_manifest.get(trip_id, [None, []])[1])
+        affected_stops.update(new_manifest.get(trip_id, [None, []])[1])
+
+    if affected_stops:
+        touching_trips = stop_times_df.loc[stop_times_df['stop_id'].astype(str).isin(affected_stops), 'trip_id'].unique()
+        touching_stop_times = stop_times_df[stop_times_df['trip_id'].isin(touching_trips)]
+        rebuilt = feed_serializers[identifier](
+            create_trip_patterns(stops_df, touching_stop_times, trip_key=feed_trip_keys[identifier],
+                                 trip_services=trip_services))
+
+        with open(output_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for stop_id in affected_stops:
+            if stop_id in rebuilt['stops']:
+                data['stops'][stop_id] = rebuilt['stops'][stop_id]
+            else:
+                data['stops'].pop(stop_id, None)
+        data['patterns'].update(rebuilt['patterns'])
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(drop_unused_patterns(data), f, ensure_ascii=False, separators=(',', ':'))
+
+    save_trip_manifest(new_manifest, manifest_file)
+    logging.info(f"{identifier.upper()}: {len(changed_trips)} trip(s) added, removed or changed, "
+                 f"{len(affected_stops)} stop(s) rebuilt in {output_file}")
+
+def _namespaced_stop(identifier, stop_data, route_types=None):
+    def line_fields(line_id):
+        # route_type gives the line its mode bit in the router (src/modes.py)
+        route_type = (route_types or {}).get(str(line_id))
+        return {} if route_type is None else {'route_type': route_type}
+
+    return dict(stop_data, operator=identifier, connections={
+        namespaced_id(identifier, line_id): dict(line_data, pattern=namespaced_id(identifier, line_data['pattern']),
+                                                 **line_fields(line_id))
+        for line_id, line_data in stop_data['connections'].items()
+    })
 
-    # Process ZKM
-    if os.path.exists(zkm_output_file):
-        logging.info("ZKM JSON file already exists. Skipping ZKM processing.")
-    else:
-        zkm_connections_by_trips = create_connections_by_trips(zkm_stops_df, zkm_stop_times_df)
-        save_to_json(zkm_connections_by_trips, zkm_output_file)
-        print(f"ZKM connections saved to {zkm_output_file}")
+def _namespaced_pattern(identifier, pattern):
+    return dict(pattern, stops=[namespaced_id(identifier, stop_id) for stop_id in pattern['stops']])
+
+def merge_operator_files(input_files, output_file, route_types=None):
+    """
+    Merges {identifier: trip pattern file} into one pattern file. Stop, line and pattern ids
+    are prefixed with the operator, so ids shared by two operators no longer overwrite each
+    other; such collisions are reported and returned as {stop_id: [identifiers]}.
+    route_types ({identifier: load_line_route_types result}) tags every known line with its route_type.
+
+    The output is written entry by entry and only one operator file is held in memory at a time
+    (the files are read twice: once for the stops, once for the patterns).
+    """
+    operators_by_stop = defaultdict(list)
+    with open(output_file, 'w', encoding='utf-8') as out:
+        for section in ('stops', 'patterns'):
+            out.write('{"stops":{' if section == 'stops' else '},"patterns":{')
+            separator = ''
+            for identifier, file_path in input_files.items():
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)[section]
+                for key, value in entries.items():
+                    if section == 'stops':
+                        operators_by_stop[key].append(identifier)
+                        value = _namespaced_stop(identifier, value, (route_types or {}).get(identifier))
+                    else:
+                        value = _namespaced_pattern(identifier, value)
+                    out.write(separator + json.dumps(namespaced_id(identifier, key)) + ':'
+                              + json.dumps(value, ensure_ascii=False, separators=(',', ':')))
+                    separator = ','
+                del entries
+        out.write('}}')
+
+    collisions = {stop_id: identifiers for stop_id, identifiers in operators_by_stop.items() if len(identifiers) > 1}
+    if collisions:
+        examples = ', '.join(f"{stop_id} ({'/'.join(identifiers)})" for stop_id, identifiers in list(collisions.items())[:10])
+        logging.warning(f"{len(collisions)} stop_id(s) used by more than one operator, kept apart in {output_file}: {examples}")
+    logging.info(f"Merged {sum(len(identifiers) for identifiers in operators_by_stop.values())} stops "
+                 f"from {len(input_files)} operator(s) into {output_file}")
+    return collisions
 
-    # Process SKM
-    if os.path.exists(skm_output_file):
-        logging.info("SKM JSON file already exists. Skipping SKM processing.")
-    else:
-        skm_connections_by_trips = create_connections_by_trips_skm(skm_stops_df, skm_stop_times_df)
-        save_to_json_skm(skm_connections_by_trips, skm_output_file)
-        print(f"SKM connections saved to {skm_output_file}")
-        
-        # Process SKM
-    if os.path.exists(mzkw_output_file):
-        logging.info("SKM JSON file already exists. Skipping SKM processing.")
+
+# Main part of the program
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download GTFS feeds and build the connections graph.")
+    parser.add_argument("--parallel", action="store_true", help="build the feeds on a process pool")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes for --parallel")
+    parser.add_argument("--shards", type=int, default=None,
+                        help="number of trip-range shards for large feeds (ZTM) in --parallel mode, defaults to --workers")
+    parser.add_argument("--incremental", action="store_true",
+                        help="patch existing connection files with the trips changed since the last build instead of skipping them")
+    args = parser.parse_args()
+
+    gtfs_data_folder = "gtfs_data"
+    ztm_output_file = 'ztm_trip_patterns.json'
+    zkm_output_file = 'zkm_trip_patterns.json'
+    skm_output_file = 'skm_trip_patterns.json'
+    mzkw_output_file = 'mzkw_trip_patterns.json'
+    output_files = {"ztm": ztm_output_file, "zkm": zkm_output_file, "skm": skm_output_file, "mzkw": mzkw_output_file}
+    feed_cache_folder = "feed_cache"
+    os.makedirs(gtfs_data_folder, exist_ok=True)
+
+    # Conditional, concurrent downloads; a feed is rebuilt when its output was not built from the current
+    # archive (compared by SHA-256), so a build interrupted after the download is redone on the next run
+    feed_cache = FeedCache(feed_cache_folder)
+    archive_hashes = {}
+    for identifier, result in feed_cache.fetch_all(gtfs_sources, max_workers=len(gtfs_sources)).items():
+        if feed_cache.export(result, archive_path(gtfs_data_folder, identifier)):
+            extract_stops_file(archive_path(gtfs_data_folder, identifier), identifier, gtfs_data_folder)
+        archive_hashes[identifier] = result.sha256
+    for identifier in output_files:
+        # Feeds that could not be fetched are built from the archive already in gtfs_data
+        if identifier not in archive_hashes and os.path.exists(archive_path(gtfs_data_folder, identifier)):
+            archive_hashes[identifier] = file_sha256(archive_path(gtfs_data_folder, identifier))
+
+    pending_files = {}
+    incremental_files = {}
+    for identifier, output_file in output_files.items():
+        if not os.path.exists(output_file):
+            pending_files[identifier] = output_file
+        elif load_source_hashes(output_file).get(identifier) == archive_hashes.get(identifier):
+            logging.info(f"{identifier.upper()} JSON file already built from the current archive. Skipping {identifier.upper()} processing.")
+        elif args.incremental and os.path.exists(manifest_path(output_file)):
+            incremental_files[identifier] = output_file
+        else:
+            pending_files[identifier] = output_file
+
+    if args.parallel:
+        build_feeds_parallel(gtfs_data_folder, pending_files, args.workers, args.shards or args.workers)
+        for identifier, output_file in pending_files.items():
+            save_source_hashes({identifier: archive_hashes.get(identifier)}, output_file)
     else:
-        mzkw_connections_by_trips = create_connections_by_trips_skm(mzkw_stops_df, mzkw_stop_times_df)
-        save_to_json_skm(mzkw_connections_by_trips, mzkw_output_file)
-        print(f"SKM connections saved to {mzkw_output_file}")
-        
-    input_files_with = [ztm_output_file, zkm_output_file, skm_output_file, mzkw_output_file]
+        for identifier, output_file in pending_files.items():
+            started = time.perf_counter()
+            stops_df, stop_times_df = load_feed(gtfs_data_folder, identifier)
+            trip_patterns = create_trip_patterns(stops_df, stop_times_df, trip_key=feed_trip_keys[identifier],
+                                                 trip_services=load_trip_services(gtfs_data_folder, identifier))
+            feed_savers[identifier](trip_patterns, output_file)
+            save_source_hashes({identifier: archive_hashes.get(identifier)}, output_file)
+            print(f"{identifier.upper()} connections saved to {output_file} in {time.perf_counter() - started:.1f}s")
+
+    if args.incremental:
+        for identifier, output_file in pending_files.items():
+            _, stop_times_df = load_feed(gtfs_data_folder, identifier)
+            save_trip_manifest(compute_trip_manifest(stop_times_df, load_trip_services(gtfs_data_folder, identifier)),
+                               manifest_path(output_file))
+        for identifier, output_file in incremental_files.items():
+            stops_df, stop_times_df = load_feed(gtfs_data_folder, identifier)
+            update_feed_incrementally(identifier, stops_df, stop_times_df, output_file, manifest_path(output_file),
+                                      load_trip_services(gtfs_data_folder, identifier))
+            save_source_hashes({identifier: archive_hashes.get(identifier)}, output_file)
+
+    # One merged file with every operator; variants such as "without SKM" are mode masks applied at query time
+    input_files_with = output_files
     output_file_with = 'merged_connections.json'
-    input_files_without = [ztm_output_file, zkm_output_file,mzkw_output_file]
-    output_file_without = 'merged_connections_without_skm.json'
-    # Uruchomienie funkcji
-    merge_json_files(input_files_with, output_file_with)
-    print(f"Polaczony plik JSON zostal zapisany jako {output_file_with}")
-    merge_json_files(input_files_without, output_file_without)
-    print(f"Polaczony plik JSON zostal zapisany jako {output_file_without}")
+    graph_directory = 'merged_connections.graph'
+    calendar_file = 'merged_calendar.json'
+
+    merged_hashes = {identifier: archive_hashes.get(identifier) for identifier in output_files}
+    if (load_source_hashes(output_file_with) == merged_hashes and os.path.exists(output_file_with)
+            and os.path.isdir(graph_directory)):
+        logging.info("Merged files and binary graph already built from the current archives.")
+    else:
+        # Uruchomienie funkcji
+        route_types = {identifier: load_line_route_types(gtfs_data_folder, identifier) for identifier in output_files}
+        merge_operator_files(input_files_with, output_file_with, route_types)
+        print(f"Polaczony plik JSON zostal zapisany jako {output_file_with}")
+
+        # Service calendars of all feeds; service keys are prefixed with the feed identifier
+        service_calendar = {}
+        for identifier in output_files:
+            service_calendar.update(load_service_calendar(gtfs_data_folder, identifier))
+        with open(calendar_file, 'w', encoding='utf-8') as f:
+            json.dump(service_calendar, f)
+        print(f"Kalendarz kursow zostal zapisany jako {calendar_file}")
+
+        # Binary graph loaded by the server instead of the merged JSON
+        binary_graph_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'binary_graph.py')
+        subprocess.run([sys.executable, binary_graph_script, output_file_with, graph_directory,
+                        '--calendar', calendar_file], check=True)
+        # Written last, so an interrupted merge or conversion is redone on the next run
+        save_source_hashes(merged_hashes, output_file_with)
@@ -0,0 +1,112 @@
+import io
+import os
+import json
+import zipfile
+import tempfile
+import unittest
+import pandas as pd
+from compare_connection_builders import FIXTURE_STOPS, FIXTURE_STOP_TIMES, compare_with_legacy, to_json
+from generate_connections_trips_ztm_zkm_skm import (
+    archive_path,
+    create_connections_by_trips,
+    create_connections_by_trips_skm,
+    create_connections_by_trips_vectorized,
+    create_trip_patterns,
+    expand_patterns,
+    feed_savers,
+    feed_trip_keys,
+    load_feed,
+    serialize_patterns,
+    serialize_patterns_skm,
+)
+
+# Row-by-row builder, trip_key of the vectorized builder, pattern serializer, whether empty lines are dropped
+BUILDERS = {
+    'trip number (ZTM/ZKM)': (create_connections_by_trips, feed_trip_keys['ztm'], serialize_patterns, False),
+    'trip id (SKM/MZKW)': (create_connections_by_trips_skm, None, serialize_patterns_skm, True),
+}
+
+# MZKW-style feed whose stop ids are not numeric
+NON_NUMERIC_STOPS = """stop_id,stop_name,stop_lat,stop_lon
+W1,Wejherowo Dworzec 01,54.6036,18.2346
+W2,Wejherowo Rynek 01,54.6055,18.2402
+W3,Wejherowo Śmiechowo 01,54.6120,18.2210
+"""
+
+NON_NUMERIC_STOP_TIMES = """trip_id,arrival_time,departure_time,stop_id,stop_sequence
+4_1,07:00:00,07:00:00,W1,1
+4_1,07:04:00,07:05:00,W2,2
+4_1,07:12:00,07:12:00,W3,3
+4_2,08:00:00,08:00:00,W1,1
+4_2,08:04:00,08:05:00,W2,2
+4_2,08:12:00,08:12:00,W3,3
+"""
+
+
+def write_feed(directory, identifier, stops, stop_times):
+    """Writes a GTFS archive with stops.txt and stop_times.txt where load_feed looks for it."""
+    with zipfile.ZipFile(archive_path(directory, identifier), 'w') as zip_ref:
+        zip_ref.writestr('stops.txt', stops)
+        zip_ref.writestr('stop_times.txt', stop_times)
+
+
+def fixture_feed():
+    return pd.read_csv(io.StringIO(FIXTURE_STOPS)), pd.read_csv(io.StringIO(FIXTURE_STOP_TIMES))
+
+
+class BuilderParityTest(unittest.TestCase):
+    """The checks of compare_connection_builders.py on its fixture feed (a loop, unsorted rows, a trip past midnight)."""
+
+    def test_vectorized_builder_matches_row_by_row_builders(self):
+        stops_df, stop_times_df = fixture_feed()
+        for label, (old_builder, trip_key, _, skip_empty) in BUILDERS.items():
+            with self.subTest(label):
+                expected = to_json(old_builder(stops_df, stop_times_df), skip_empty)
+                actual = to_json(create_connections_by_trips_vectorized(stops_df, stop_times_df, trip_key=trip_key), skip_empty)
+                matches, midnight = compare_with_legacy(expected, actual)
+                self.assertTrue(matches)
+                # The old builders gave negative travel times on the trip past midnight
+                self.assertGreater(midnight, 0)
+
+    def test_trip_patterns_expand_to_vectorized_connections(self):
+        stops_df, stop_times_df = fixture_feed()
+        for label, (_, trip_key, serializer, skip_empty) in BUILDERS.items():
+            with self.subTest(label):
+                expected = to_json(create_connections_by_trips_vectorized(stops_df, stop_times_df, trip_key=trip_key), skip_empty)
+                saved = json.loads(json.dumps(serializer(create_trip_patterns(stops_df, stop_times_df, trip_key=trip_key))))
+                self.assertEqual(to_json(expand_patterns(saved), skip_empty), expected)
+
+    def test_archive_feed_builds_the_same_patterns(self):
+        stops_df, stop_times_df = fixture_feed()
+        expected = serialize_patterns(create_trip_patterns(stops_df, stop_times_df))
+        with tempfile.TemporaryDirectory() as directory:
+            write_feed(directory, 'ztm', FIXTURE_STOPS, FIXTURE_STOP_TIMES)
+            archive_stops_df, archive_stop_times_df = load_feed(directory, 'ztm')
+        self.assertEqual(serialize_patterns(create_trip_patterns(archive_stops_df, archive_stop_times_df)), expected)
+
+    def test_missing_archive_names_the_feed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaisesRegex(FileNotFoundError, r'archive for zkm .*zkm\.zip'):
+                load_feed(directory, 'zkm')
+
+
+class NonNumericStopIdsTest(unittest.TestCase):
+
+    def test_feed_with_non_numeric_stop_ids_is_built(self):
+        with tempfile.TemporaryDirectory() as directory:
+            write_feed(directory, 'mzkw', NON_NUMERIC_STOPS, NON_NUMERIC_STOP_TIMES)
+            stops_df, stop_times_df = load_feed(directory, 'mzkw')
+            output_file = os.path.join(directory, 'mzkw_trip_patterns.json')
+            feed_savers['mzkw'](create_trip_patterns(stops_df, stop_times_df, trip_key=feed_trip_keys['mzkw']), output_file)
+            with open(output_file, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+
+        self.assertEqual(set(saved['stops']), {'W1', 'W2'})
+        self.assertEqual(saved['stops']['W1']['stop_id'], 'W1')
+        connections = expand_patterns(saved)
+        self.assertEqual(connections['W1']['connections']['4_1']['to_stations'], {'W2': 240, 'W3': 720})
+        self.assertEqual(connections['W2']['connections']['4_2']['departure_times'], [29100])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import hashlib
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from feed_cache import FeedCache, file_sha256
+
+
+class FeedServer(ThreadingHTTPServer):
+    """Local stand-in for a GTFS feed URL: serves self.content with an ETag derived from it."""
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FeedHandler)
+        self.content = b''
+        self.send_validators = True
+        self.requests = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}/gtfs.zip"
+
+    @property
+    def etag(self):
+        return '"' + hashlib.sha256(self.content).hexdigest()[:16] + '"'
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        if server.send_validators and self.headers.get('If-None-Match') == server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(server.content)))
+        if server.send_validators:
+            self.send_header('ETag', server.etag)
+            self.send_header('Last-Modified', 'Sat, 17 Oct 2026 06:00:00 GMT')
+        self.end_headers()
+        self.wfile.write(server.content)
+
+    def log_message(self, *args):
+        pass
+
+
+class FeedCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FeedServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = FeedCache(self.directory.name, timeout=5)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def test_first_fetch_stores_archive_under_its_hash(self):
+        self.server.content = b'first archive'
+        result = self.cache.fetch('ztm', self.server.url)
+        self.assertTrue(result.changed)
+        self.assertEqual(result.sha256, hashlib.sha256(b'first archive').hexdigest())
+        self.assertEqual(result.path, self.cache.object_path(result.sha256))
+        self.assertEqual(file_sha256(result.path), result.sha256)
+        self.assertEqual(self.cache.index['ztm']['etag'], self.server.etag)
+        self.assertNotIn('If-None-Match', self.server.requests[0])
+
+    def test_not_modified_reuses_cached_archive(self):
+        self.server.content = b'first archive'
+        first = self.cache.fetch('ztm', self.server.url)
+        second = self.cache.fetch('ztm', self.server.url)
+        self.assertEqual(self.server.requests[1]['If-None-Match'], self.server.etag)
+        self.assertEqual(self.server.requests[1]['If-Modified-Since'], 'Sat, 17 Oct 2026 06:00:00 GMT')
+        self.assertFalse(second.changed)
+        self.assertEqual(second.sha256, first.sha256)
+
+    def test_validators_survive_a_restart(self):
+        self.server.content = b'first archive'
+        self.cache.fetch_all({'ztm': self.server.url})
+        result = FeedCache(self.directory.name, timeout=5).fetch('ztm', self.server.url)
+        self.assertEqual(self.server.requests[1]['If-None-Match'], self.server.etag)
+        self.assertFalse(result.changed)
+
+    def test_changed_content_is_downloaded_and_old_archive_pruned(self):
+        self.server.content = b'first archive'
+        first = self.cache.fetch_all({'ztm': self.server.url})['ztm']
+        self.server.content = b'second archive'
+        second = self.cache.fetch_all({'ztm': self.server.url})['ztm']
+        self.assertTrue(second.changed)
+        self.assertEqual(second.sha256, hashlib.sha256(b'second archive').hexdigest())
+        self.assertEqual(self.cache.index['ztm']['etag'], self.server.etag)
+        self.assertFalse(os.path.exists(first.path))
+        self.assertTrue(os.path.exists(second.path))
+
+    def test_same_content_without_validators_is_unchanged(self):
+        self.server.send_validators = False
+        self.server.content = b'first archive'
+        self.cache.fetch('ztm', self.server.url)
+        result = self.cache.fetch('ztm', self.server.url)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertFalse(result.changed)
+
+    def test_export_copies_only_different_content(self):
+        self.server.content = b'first archive'
+        result = self.cache.fetch('ztm', self.server.url)
+        destination = os.path.join(self.directory.name, 'ztm.zip')
+        self.assertTrue(self.cache.export(result, destination))
+        self.assertFalse(self.cache.export(result, destination))
+        self.assertEqual(file_sha256(destination), result.sha256)
+
+
+if __name__ == "__main__":
+    unittest.main()
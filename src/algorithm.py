@@ -1,86 +1,249 @@
 import json
-import re
+import os
 import matplotlib.pyplot as plt
 import csv
 from datetime import datetime, timedelta
 from heapq import heappop, heappush
-
-def load_connections(json_file):
+from binary_graph import ConnectionsView
+from trip_patterns import is_pattern_data, iter_expanded_stops, pattern_segment
+from connection_scan import csa_all_times
+from raptor import raptor_all_times, raptor_arrive_by_times, raptor_journey, raptor_profile
+import timetable
+from timetable import departure_array, next_departure, index_departures, add_minute_tables
+from result_cache import time_bucket
+from footpaths import add_transfers, TRANSFER_RADIUS
+from stop_index import stop_index, UnknownOriginError
+from object_cache import ObjectCache
+from modes import line_mode_bits, line_allowed
+from stop_clusters import (CLUSTER_RADIUS, build_stop_clusters, clusters_path, data_stops, load_stop_clusters,
+                           save_stop_clusters)
+
+# Optional ResultCache of heatmap results, set by the server (see integration_algorithm.load_data)
+result_cache = None
+
+def set_result_cache(cache):
+    global result_cache
+    result_cache = cache
+
+def get_result_cache():
+    return result_cache
+
+# Times are integer seconds since the start of the service day everywhere in the router
+# (values past 24h belong to trips running after midnight); strings only at the edges.
+def time_to_seconds(time_str):
+    hours, minutes, seconds = map(int, time_str.split(':'))
+    return hours * 3600 + minutes * 60 + seconds
+
+def seconds_to_time(seconds):
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def merge_departures(line_data, parts):
+    """
+    Sets departure_times of line_data from the lines of all platforms merged into it, with departure_services
+    when any of them has them (an empty list runs every day).
+    """
+    if len(parts) == 1:
+        line_data['departure_times'] = parts[0]['departure_times']
+        if 'departure_services' in parts[0]:
+            line_data['departure_services'] = parts[0]['departure_services']
+        return
+    if not any('departure_services' in part for part in parts):
+        line_data['departure_times'] = departure_array(time for part in parts for time in part['departure_times'])
+        return
+    services_by_time = {}
+    for part in parts:
+        services = part.get('departure_services') or [[] for _ in part['departure_times']]
+        for time, time_services in zip(part['departure_times'], services):
+            if time not in services_by_time:
+                services_by_time[time] = set(time_services)
+            elif services_by_time[time] and time_services:
+                services_by_time[time].update(time_services)
+            else:
+                services_by_time[time] = set()
+    merged_times = sorted(services_by_time)
+    line_data['departure_times'] = merged_times
+    line_data['departure_services'] = [sorted(services_by_time[time]) for time in merged_times]
+
+def load_connections(json_file, transfer_radius=TRANSFER_RADIUS, cluster_radius=None):
+    """
+    Router stops keyed by name. Platforms are grouped by the cluster table built with the file
+    (stop_clusters.py, read from next to json_file), so loading does no clustering of its own.
+    With cluster_radius (the build) the table is computed and saved first; without a table it is
+    computed in memory only.
+    """
     with open(json_file, 'r', encoding='utf-8') as f:
         data = json.load(f)
 
-    merged_connections = {}
-    id_to_normalized_name = {}
-
-    def normalize_stop_name(name):
-        return re.sub(r"\s+\d+$", "", name)
+    path = clusters_path(json_file)
+    clusters = load_stop_clusters(path) if cluster_radius is None and os.path.exists(path) else None
+    stop_ids = data['stops'] if is_pattern_data(data) else data
+    if clusters is None or any(stop_id not in clusters for stop_id in stop_ids):
+        clusters = build_stop_clusters(data_stops(data), cluster_radius or CLUSTER_RADIUS)
+        if cluster_radius is not None:
+            save_stop_clusters(clusters, path, cluster_radius)
 
-    for stop_id, stop_data in data.items():
-        normalized_name = normalize_stop_name(stop_data['stop_name'])
-        id_to_normalized_name[stop_id] = normalized_name
-
-        if normalized_name in merged_connections:
-            existing_data = merged_connections[normalized_name]
-            existing_data['latitudes'].append(stop_data['lat'])
-            existing_data['longitudes'].append(stop_data['lon'])
-            existing_data['stop_ids'].append(stop_id)
-
-            for line_id, line_data in stop_data['connections'].items():
-                if line_id not in existing_data['connections']:
-                    existing_data['connections'][line_id] = {
-                        "departure_times": line_data['departure_times'],
-                        "to_stations": {}
-                    }
-                existing_line = existing_data['connections'][line_id]
-                existing_line['departure_times'] = list(
-                    set(existing_line['departure_times'] + line_data['departure_times']))
-                for next_stop, travel_time in line_data['to_stations'].items():
-                    normalized_next_stop = id_to_normalized_name.get(next_stop, next_stop)
-                    if normalized_next_stop not in existing_line['to_stations']:
-                        existing_line['to_stations'][normalized_next_stop] = travel_time
-
-        else:
-            merged_connections[normalized_name] = {
-                "stop_name": normalized_name,
-                "latitudes": [stop_data['lat']],
-                "longitudes": [stop_data['lon']],
-                "stop_ids": [stop_id],
+    merged_connections = {}
+    # Departures of every merged line, combined once all platforms are read
+    departure_parts = {}
+
+    # Trip-pattern files are expanded stop by stop into the to_stations layout
+    patterns = data['patterns'] if is_pattern_data(data) else None
+    stops = iter_expanded_stops(data) if patterns is not None else data.items()
+    for stop_id, stop_data in stops:
+        stop_name = clusters[stop_id]
+        if stop_name not in merged_connections:
+            merged_connections[stop_name] = {
+                "stop_name": stop_name,
+                "latitudes": [],
+                "longitudes": [],
+                "stop_ids": [],
                 "connections": {}
             }
-            for line_id, line_data in stop_data['connections'].items():
-                new_line_data = {
-                    "departure_times": line_data['departure_times'],
-                    "to_stations": {}
-                }
-                for next_stop, travel_time in line_data['to_stations'].items():
-                    normalized_next_stop = id_to_normalized_name.get(next_stop, next_stop)
-                    new_line_data['to_stations'][normalized_next_stop] = travel_time
-                merged_connections[normalized_name]['connections'][line_id] = new_line_data
+        merged = merged_connections[stop_name]
+        merged['latitudes'].append(stop_data['lat'])
+        merged['longitudes'].append(stop_data['lon'])
+        merged['stop_ids'].append(stop_id)
 
-    for stop_name, stop_data in merged_connections.items():
         for line_id, line_data in stop_data['connections'].items():
-            line_data['to_stations'] = {id_to_normalized_name.get(stop, stop): time for stop, time in
-                                        line_data['to_stations'].items()}
-
+            if line_id not in merged['connections']:
+                merged['connections'][line_id] = {
+                    "to_stations": {},
+                    # Mode and operator bits of the line, see modes.py
+                    "modes": line_mode_bits(line_id, line_data.get('route_type'))
+                }
+                departure_parts[(stop_name, line_id)] = []
+            departure_parts[(stop_name, line_id)].append(line_data)
+            # Stops outside the table (never departed from) keep their stop_id; the first platform's time wins
+            to_stations = merged['connections'][line_id]['to_stations']
+            for next_stop, travel_time in line_data['to_stations'].items():
+                to_stations.setdefault(clusters.get(next_stop, next_stop), travel_time)
+            if patterns is not None:
+                # The pattern behind to_stations, so the binary graph stores it instead of the expanded stops
+                merged['connections'][line_id].setdefault('segments', []).append(
+                    pattern_segment(data['stops'][stop_id]['connections'][line_id], patterns))
+
+    for (stop_name, line_id), parts in departure_parts.items():
+        line_data = merged_connections[stop_name]['connections'][line_id]
+        merge_departures(line_data, parts)
+        # Sorted once here, so routing can binary search the departures
+        index_departures(line_data)
+
+    if transfer_radius:
+        # Footpaths between nearby stops of different clusters
+        add_transfers(merged_connections, transfer_radius)
+    # Origin lookups are hash lookups from the first query on
+    stop_index(merged_connections)
     return merged_connections
 
-def generate_heatmap(start_location, start_time, connections):
-    if start_location in connections:
-        start_name = start_location
-        start_id = start_location
+def load_calendar(json_file):
+    """Service calendar written by the build: {service key: [YYYYMMDD, ...]}."""
+    with open(json_file, 'r', encoding='utf-8') as f:
+        return {service: set(dates) for service, dates in json.load(f).items()}
+
+def parse_service_date(service_date):
+    if isinstance(service_date, str):
+        return datetime.strptime(service_date, "%Y-%m-%d").date()
+    return service_date
+
+def active_services(calendar, service_date):
+    day = parse_service_date(service_date).strftime("%Y%m%d")
+    return {service for service, dates in calendar.items() if day in dates}
+
+# Per-day timetable partitions of the last few (graph, calendar, date) queries
+DATE_PARTITION_CACHE_SIZE = 4
+_date_partitions = ObjectCache(DATE_PARTITION_CACHE_SIZE)
+
+def connections_for_date(connections, calendar, service_date):
+    """
+    The connections with only the departures whose service runs on service_date. Departures
+    without service information (feeds without calendar.txt) are always kept, and without a
+    calendar every departure is (a binary graph carries its own calendar).
+    """
+    service_date = parse_service_date(service_date)
+    if calendar is None and not isinstance(connections, ConnectionsView):
+        return connections
+    return _date_partitions.get((connections, calendar), lambda: date_partition(connections, calendar, service_date),
+                                key=(service_date,))
+
+def date_partition(connections, calendar, service_date):
+    if isinstance(connections, ConnectionsView):
+        partition = connections.graph.for_date(service_date).connections()
     else:
-        start_name = connections[start_location]['stop_name']
-        start_id = start_location
-
-    times = dijkstra_all_times(connections, start_id, start_time)
-
-    lats, lons, travel_times = [], [], []
+        active = active_services(calendar, service_date)
+        partition = {}
+        for stop_name, stop_data in connections.items():
+            lines = {}
+            for line_id, line_data in stop_data['connections'].items():
+                services = line_data.get('departure_services')
+                if services is None:
+                    lines[line_id] = line_data
+                    continue
+                departures = [time for time, time_services in zip(line_data['departure_times'], services)
+                              if not time_services or not active.isdisjoint(time_services)]
+                if departures:
+                    lines[line_id] = {'departure_times': departure_array(departures),
+                                      'to_stations': line_data['to_stations'], 'modes': line_data['modes']}
+            partition[stop_name] = dict(stop_data, connections=lines)
+    return partition
+
+def heatmap_start(start_location, connections):
+    if start_location in connections:
+        return start_location, start_location
+    return connections[start_location]['stop_name'], start_location
+
+def generate_heatmap(start_location, start_time, connections, algorithm="dijkstra", max_transfers=None,
+                     max_travel_time=None, arrive_by=False, modes=None):
+    """
+    With arrive_by, start_location is the destination, start_time the arrival time and the travel time of
+    a stop is how long before start_time one has to leave it (latest departure, reverse search).
+    modes is a mode mask (modes.mode_mask) of the lines that may be used, None for all of them.
+    """
+    start_name, start_id = heatmap_start(start_location, connections)
+
+    options = {}
+    if max_transfers is not None:
+        if algorithm != "raptor":
+            raise ValueError(f"Algorithm {algorithm} does not support max_transfers, use raptor")
+        options['max_transfers'] = max_transfers
+    engine = ROUTING_ALGORITHMS[algorithm]
+    if arrive_by:
+        if algorithm != "raptor":
+            raise ValueError(f"Algorithm {algorithm} does not support arrive_by, use raptor")
+        engine = raptor_arrive_by_times
+    times = engine(connections, start_id, start_time, max_travel_time=max_travel_time, modes=modes, **options)
+    # The output files keep travel times in minutes
+    times = {stop_id: travel_time // 60 for stop_id, travel_time in times.items() if travel_time != float('inf')}
+    return save_travel_data(start_name, start_id, connections, times, arrive_by=arrive_by)
+
+def generate_profile_heatmap(start_location, window_start, window_end, connections, max_transfers=None,
+                             max_travel_time=None, modes=None):
+    """
+    Heatmap data for every start minute of [window_start, window_end): travel_time is the median
+    and min_travel_time/median_travel_time/p90_travel_time are written next to it.
+    """
+    start_name, start_id = heatmap_start(start_location, connections)
+    profile = raptor_profile(connections, start_id, window_start, window_end, max_transfers, max_travel_time, modes)
+    # A stop is shown when it is reachable for at least half of the start minutes
+    statistics = {stop_id: {f"{field}_travel_time": int(value // 60) for field, value in values.items()
+                            if value != float('inf')}
+                  for stop_id, values in profile.items() if values['median'] != float('inf')}
+    times = {stop_id: values['median_travel_time'] for stop_id, values in statistics.items()}
+    return save_travel_data(start_name, start_id, connections, times, statistics)
+
+def save_travel_data(start_name, start_id, connections, times, statistics=None, arrive_by=False):
+    """
+    Writes travel_times.csv and travel_data.json and returns the latter; statistics adds extra per-stop fields,
+    arrive_by marks start_station as the destination of a reverse search.
+    """
+    lats, lons, travel_times, extra_fields = [], [], [], []
 
     start_stop_data = connections[start_name]
+    start_fields = {field: 0 for values in statistics.values() for field in values} if statistics else {}
     for lat, lon in zip(start_stop_data["latitudes"], start_stop_data["longitudes"]):
         lats.append(lat)
         lons.append(lon)
         travel_times.append(0)
+        extra_fields.append(start_fields)
 
     for stop_id, travel_time in times.items():
         if stop_id != start_id and travel_time != float('inf'):
@@ -89,12 +252,7 @@ def generate_heatmap(start_location, start_time, connections):
                 lats.append(lat)
                 lons.append(lon)
                 travel_times.append(travel_time)
-
-    with open('travel_times.csv', mode='w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow(["Latitude", "Longitude", "Travel Time (minutes)"])
-        for lat, lon, travel_time in zip(lats, lons, travel_times):
-            writer.writerow([lat, lon, travel_time])
+                extra_fields.append(statistics[stop_id] if statistics else {})
 
     # NOT USED
     # plt.scatter(lons, lats, c=travel_times, cmap='hot', marker='o')
@@ -111,92 +269,192 @@ def generate_heatmap(start_location, start_time, connections):
         'start_station': {
             'lat': start_stop_data["latitudes"][0],
             'lon': start_stop_data["longitudes"][0],
-            'travel_time': 0
+            'travel_time': 0,
+            **start_fields
         },
         'other_stations': [
-            {'lat': lat, 'lon': lon, 'travel_time': time}
-            for lat, lon, time in zip(lats[1:], lons[1:], travel_times[1:])
+            {'lat': lat, 'lon': lon, 'travel_time': time, **fields}
+            for lat, lon, time, fields in zip(lats[1:], lons[1:], travel_times[1:], extra_fields[1:])
         ]
     }
+    if arrive_by:
+        travel_data['arrive_by'] = True
+
+    write_travel_files(travel_data)
+    return travel_data
+
+def write_travel_files(travel_data):
+    """travel_data.json for generate_heatmap.py and travel_times.csv (one row per stop coordinate)."""
+    stations = [travel_data['start_station']] + travel_data['other_stations']
+    with open('travel_times.csv', mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(["Latitude", "Longitude", "Travel Time (minutes)"])
+        for station in stations:
+            writer.writerow([station['lat'], station['lon'], station['travel_time']])
 
     with open('travel_data.json', 'w', encoding='utf-8') as f:
         json.dump(travel_data, f, ensure_ascii=False, indent=4)
 
-def starting_algorithm(connections, query, start_time):
-    if isinstance(query, int) or (isinstance(query, str) and query.isdigit()):
-        # Treat as stop_id
-        stop_id = str(query)
-        for stop_name, stop_data in connections.items():
-            if stop_id in stop_data['stop_ids']:
-                stop_name = str(stop_name)
-                return {
-                    generate_heatmap(stop_name, start_time, connections)
-                }
-
-    elif isinstance(query, list) and len(query) == 2 and all(isinstance(coord, (float, int)) for coord in query):
-        # Treat as coordinates [latitude, longitude]
-        latitude, longitude = query
-        for stop_name, stop_data in connections.items():
-            for lat, lon in zip(stop_data['latitudes'], stop_data['longitudes']):
-                if abs(lat - latitude) < 1e-5 and abs(lon - longitude) < 1e-5:
-                    stop_name = str(stop_name)
-                    return {
-                        generate_heatmap(stop_name, start_time, connections)
-                    }
-
-    elif isinstance(query, str):
-        # Treat as stop name
-        stop_name = query
-        if stop_name in connections:
-            stop_name = str(stop_name)
-            return {
-                generate_heatmap(stop_name, start_time, connections)
-            }
+def heatmap_cache_key(stop_name, start_time, service_date=None, algorithm="dijkstra", max_transfers=None,
+                      window_minutes=None, max_travel_time=None, arrive_by=False, modes=None, **extra):
+    """
+    Key of a starting_algorithm result in result_cache; extra options (e.g. the time field of a
+    rendered heatmap) give the keys of files derived from that result.
+    """
+    return result_cache.key(stop_name, start_time, {
+        'algorithm': algorithm, 'max_transfers': max_transfers, 'window_minutes': window_minutes,
+        'max_travel_time': max_travel_time, 'arrive_by': arrive_by, 'modes': modes,
+        'service_date': str(service_date) if service_date is not None else None, **extra,
+    })
+
+def starting_algorithm(connections, query, start_time, service_date=None, calendar=None, algorithm="dijkstra",
+                       max_transfers=None, window_minutes=None, max_travel_time=None, arrive_by=False, modes=None):
+    """
+    With arrive_by, query is the destination and start_time the time to arrive by; modes is a mode mask.
+    Raises UnknownOriginError when query matches no stop.
+    """
+    if isinstance(start_time, str):
+        start_time = time_to_seconds(start_time)
+    if arrive_by and window_minutes:
+        raise ValueError("Arrive-by queries do not support a departure window")
+
+    def heatmap(stop_name):
+        if window_minutes:
+            # Profile over every start minute of the window instead of a single start time
+            return generate_profile_heatmap(stop_name, start_time, start_time + window_minutes * 60, connections,
+                                            max_transfers, max_travel_time, modes)
+        return generate_heatmap(stop_name, start_time, connections, algorithm, max_transfers, max_travel_time,
+                                arrive_by, modes)
+
+    # Resolved on the full connections, whose index is built at load time; a date partition has the same stops
+    stop_name = find_start_stop(connections, query)
+    if service_date is not None:
+        # Route only over the departures running on that day
+        connections = connections_for_date(connections, calendar, service_date)
+    if result_cache is None:
+        return heatmap(stop_name)
+
+    # Routed from the start of the time bucket, so every query in the bucket gets the same result
+    start_time = time_bucket(start_time)
+    key = heatmap_cache_key(stop_name, start_time, service_date, algorithm, max_transfers, window_minutes,
+                            max_travel_time, arrive_by, modes)
+    travel_data = result_cache.get(key)
+    if travel_data is None:
+        travel_data = heatmap(stop_name)
+        result_cache.put(key, travel_data)
+    else:
+        write_travel_files(travel_data)
+    return travel_data
+
+def plan_journey(connections, origin, destination, start_time, service_date=None, calendar=None, max_transfers=None,
+                 modes=None):
+    """
+    Point-to-point journey for the frontend: the legs of the earliest arrival at destination when leaving
+    origin at start_time, each with line (None for a walk), stops with their coordinates, departure and
+    arrival as HH:MM:SS and minutes; None when destination cannot be reached. Raises UnknownOriginError.
+    """
+    if isinstance(start_time, str):
+        start_time = time_to_seconds(start_time)
+    start, target = find_start_stop(connections, origin), find_start_stop(connections, destination)
+    if service_date is not None:
+        connections = connections_for_date(connections, calendar, service_date)
+    legs = raptor_journey(connections, start, target, start_time, max_transfers, modes=modes)
+    if legs is None:
+        return None
+
+    def stop_point(stop_name):
+        return {'name': stop_name, 'lat': connections[stop_name]['latitudes'][0],
+                'lon': connections[stop_name]['longitudes'][0]}
+
+    return {
+        'departure': seconds_to_time(start_time),
+        'arrival': seconds_to_time(legs[-1]['arrival'] if legs else start_time),
+        'travel_time': ((legs[-1]['arrival'] if legs else start_time) - start_time) // 60,
+        'legs': [{'line': leg['line'], 'from': stop_point(leg['from_stop']), 'to': stop_point(leg['to_stop']),
+                  'departure': seconds_to_time(leg['departure']), 'arrival': seconds_to_time(leg['arrival']),
+                  'minutes': (leg['arrival'] - leg['departure']) // 60}
+                 for leg in legs]
+    }
 
-def dijkstra_all_times(connections, start, departure_time):
+def find_start_stop(connections, query, near=None):
+    """
+    Name of the router stop for a stop_id, [latitude, longitude] or stop name, looked up in the
+    StopIndex of the connections; raises UnknownOriginError when nothing (or no single stop) matches.
+    near ([latitude, longitude]) picks between operators that share a stop_id.
+    """
+    return stop_index(connections).resolve(query, near)
+
+# (tables, bytes) of the connections objects whose lines got minute tables (see timetable.enable_minute_tables)
+MINUTE_TABLE_CACHE_SIZE = 4
+_minute_tables = ObjectCache(MINUTE_TABLE_CACHE_SIZE)
+
+def dijkstra_minute_tables(connections):
+    """Adds minute tables to the busiest lines the first time Dijkstra routes over connections; (tables, bytes) or None."""
+    if timetable.minute_table_options is None:
+        return None
+    return _minute_tables.get((connections,), lambda: add_minute_tables(connections, **timetable.minute_table_options))
+
+def dijkstra_all_times(connections, start, departure_time, max_travel_time=None, modes=None):
+    """
+    Earliest arrival at every stop, as seconds after departure_time (seconds since the start of the service day).
+    Labels beyond max_travel_time (seconds) are not expanded and those stops stay unreachable (inf).
+    modes is a mode mask (modes.mode_mask); lines outside it are skipped.
+    """
+    dijkstra_minute_tables(connections)
     times = {stop_id: float('inf') for stop_id in connections}
     times[start] = 0
 
     visited = set()
-    pq = [(0, start, departure_time)]
+    pq = [(0, start)]
 
     while pq:
-        current_time, current_stop, current_departure = heappop(pq)
+        current_time, current_stop = heappop(pq)
 
         if current_stop in visited:
             continue
 
         visited.add(current_stop)
+        # Clock at the moment we are at current_stop
+        current_clock = departure_time + current_time
+
+        for next_stop, walking_time in connections[current_stop].get('transfers', {}).items():
+            total_travel_time = current_time + walking_time
+            if next_stop not in times or max_travel_time is not None and total_travel_time > max_travel_time:
+                continue
+            if total_travel_time < times[next_stop]:
+                times[next_stop] = total_travel_time
+                heappush(pq, (total_travel_time, next_stop))
 
         for line_id, line_data in connections[current_stop]['connections'].items():
+            if not line_allowed(line_data.get('modes', 0), modes):
+                continue
+            scheduled_departure = next_departure(line_data['departure_times'], current_clock,
+                                                 line_data.get('minute_table'))
+            if scheduled_departure is None:
+                continue
+
+            wait_time = scheduled_departure - current_clock
             for next_stop, travel_time in line_data['to_stations'].items():
-                departure_times = sorted(line_data['departure_times'])
-
-                scheduled_departure = None
-                for dep_time in departure_times:
-                    if dep_time >= current_departure:
-                        scheduled_departure = dep_time
-                        break
-
-                if scheduled_departure is None:
+                # Stops that never appear as a departure stop cannot be routed through
+                if next_stop not in times:
                     continue
 
-                scheduled_departure_dt = datetime.strptime(scheduled_departure, "%H:%M:%S")
-                current_departure_dt = datetime.strptime(current_departure, "%H:%M:%S")
-                wait_time = max((scheduled_departure_dt - current_departure_dt).seconds // 60, 0)
-
                 total_travel_time = current_time + wait_time + travel_time
-
-                if total_travel_time < 0:
-                    total_travel_time += 1440
-
+                if max_travel_time is not None and total_travel_time > max_travel_time:
+                    continue
                 if total_travel_time < times[next_stop]:
                     times[next_stop] = total_travel_time
-                    heappush(pq,
-                             (total_travel_time, next_stop, scheduled_departure))
+                    heappush(pq, (total_travel_time, next_stop))
 
     return times
 
+# One-to-all engines selectable in starting_algorithm/generate_heatmap; all return the same times dict
+ROUTING_ALGORITHMS = {
+    "dijkstra": dijkstra_all_times,
+    "csa": csa_all_times,
+    "raptor": raptor_all_times,
+}
+
 if __name__ == "__main__":
     connections = load_connections('connections_by_trips.json')
     #testy
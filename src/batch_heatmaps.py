@@ -0,0 +1,119 @@
+import os
+import time
+import argparse
+import multiprocessing
+import numpy as np
+from algorithm import (load_connections, load_calendar, connections_for_date, find_start_stop, time_to_seconds,
+                       ROUTING_ALGORITHMS, UnknownOriginError)
+from binary_graph import load_binary_graph
+
+# Read-only state of a worker process, set once by init_worker
+_worker = {}
+
+
+def load_graph(path):
+    """A graph directory is memory-mapped, so all workers share its pages through the OS page cache."""
+    if os.path.isdir(path):
+        return load_binary_graph(path).connections()
+    return load_connections(path)
+
+
+def prepare_connections(graph_path, service_date=None, calendar_path=None, connections=None):
+    connections = connections if connections is not None else load_graph(graph_path)
+    if service_date is not None:
+        connections = connections_for_date(connections, load_calendar(calendar_path) if calendar_path else None,
+                                           service_date)
+    return connections
+
+
+def init_worker(graph_path, algorithm, service_date=None, calendar_path=None, max_travel_time=None):
+    # With the fork start method the graph prepared by run_batch is inherited copy-on-write;
+    # with spawn (Windows) every worker loads it on its own
+    if _worker.get('key') != (graph_path, service_date):
+        _worker.update(key=(graph_path, service_date),
+                       connections=prepare_connections(graph_path, service_date, calendar_path))
+    _worker.update(stop_names=list(_worker['connections']), engine=ROUTING_ALGORITHMS[algorithm],
+                   max_travel_time=max_travel_time)
+
+
+def run_job(job):
+    """(index, origin, start time in seconds) -> (index, int32 travel seconds per stop, -1 unreachable)."""
+    index, origin, start_time = job
+    connections = _worker['connections']
+    try:
+        stop_name = find_start_stop(connections, origin)
+    except UnknownOriginError:
+        return index, None
+    times = _worker['engine'](connections, stop_name, start_time, max_travel_time=_worker['max_travel_time'])
+    return index, np.array([-1 if times[stop] == float('inf') else times[stop] for stop in _worker['stop_names']],
+                           dtype=np.int32)
+
+
+def run_batch(graph_path, jobs, output_file, algorithm="raptor", workers=None, service_date=None, calendar_path=None,
+              chunksize=8, connections=None, max_travel_time=None):
+    """
+    Computes one-to-all travel times for every (origin, start time) job on a process pool and writes
+    them to one columnar .npz file: stop_names, origins, start_times and travel_seconds[job, stop].
+    Returns the number of jobs whose origin was not found (their row is all -1).
+    """
+    jobs = [(index, origin, time_to_seconds(start_time) if isinstance(start_time, str) else start_time)
+            for index, (origin, start_time) in enumerate(jobs)]
+    # Prepared in the parent first: forked workers then share it instead of loading their own copy
+    connections = prepare_connections(graph_path, service_date, calendar_path, connections)
+    _worker.update(key=(graph_path, service_date), connections=connections)
+    stop_names = list(connections)
+    if jobs:
+        # Engines build their arrays on the first query, so that happens once here and not in every worker
+        try:
+            ROUTING_ALGORITHMS[algorithm](connections, find_start_stop(connections, jobs[0][1]), jobs[0][2])
+        except UnknownOriginError:
+            pass  # Reported with the other missing origins below
+    travel_seconds = np.full((len(jobs), len(stop_names)), -1, dtype=np.int32)
+
+    missing = 0
+    started = time.perf_counter()
+    with multiprocessing.Pool(workers, initializer=init_worker,
+                              initargs=(graph_path, algorithm, service_date, calendar_path, max_travel_time)) as pool:
+        for index, row in pool.imap_unordered(run_job, jobs, chunksize=chunksize):
+            if row is None:
+                missing += 1
+                print(f"Origin not found: {jobs[index][1]}")
+            else:
+                travel_seconds[index] = row
+    elapsed = time.perf_counter() - started
+
+    np.savez_compressed(output_file, stop_names=np.array(stop_names), origins=np.array([str(job[1]) for job in jobs]),
+                        start_times=np.array([job[2] for job in jobs], dtype=np.int32), travel_seconds=travel_seconds)
+    print(f"{len(jobs)} jobs in {elapsed:.1f} s ({len(jobs) / max(elapsed, 1e-9):.1f} jobs/s) saved to {output_file}")
+    return missing
+
+
+def read_origins(path, connections):
+    """One origin per line (stop name or stop_id); every router stop when no file is given."""
+    if path is None:
+        return list(connections)
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute heatmap travel times for many origins and start times in parallel.")
+    parser.add_argument("graph", help="binary graph directory (preferred) or merged_connections.json")
+    parser.add_argument("output_file", help="columnar output, e.g. batch_travel_times.npz")
+    parser.add_argument("--origins", help="file with one origin per line (default: all stops)")
+    parser.add_argument("--times", default="08:00:00", help="comma separated start times, e.g. 07:00:00,12:00:00,17:00:00")
+    parser.add_argument("--date", help="service date YYYY-MM-DD, requires --calendar")
+    parser.add_argument("--calendar", help="service calendar, e.g. merged_calendar.json")
+    parser.add_argument("--algorithm", default="raptor", choices=sorted(ROUTING_ALGORITHMS))
+    parser.add_argument("--workers", type=int, help="worker processes (default: number of CPUs)")
+    parser.add_argument("--max-travel-time", type=int, help="cutoff in minutes; slower stops are stored as unreachable")
+    args = parser.parse_args()
+
+    connections = load_graph(args.graph)
+    origins = read_origins(args.origins, connections)
+    jobs = [(origin, start_time) for start_time in args.times.split(',') for origin in origins]
+    missing = run_batch(args.graph, jobs, args.output_file, args.algorithm, args.workers, args.date, args.calendar,
+                        connections=connections,
+                        max_travel_time=args.max_travel_time * 60 if args.max_travel_time else None)
+    if missing:
+        raise SystemExit(1)
@@ -0,0 +1,381 @@
+import os
+import json
+import hashlib
+import argparse
+from array import array
+from datetime import datetime
+from collections.abc import Mapping
+import numpy as np
+from modes import line_mode_bits
+
+# Bumped whenever the layout of the arrays below changes
+FORMAT_VERSION = 6
+
+# CSR layout of the router graph (platforms clustered into stops by stop_clusters.py):
+#   stop_name[s], stop_id_offsets/stop_id_values   -> string table indices
+#   coord_offsets/coord_lat/coord_lon               -> coordinates of the stops merged into s
+#   stop_line_offsets[s]..[s+1]                     -> lines l departing from s, line_key[l] -> string table,
+#                                                      line_modes[l] (uint16 mode and operator bits, see modes.py)
+#   line_departure_offsets[l]..[l+1]                -> departure_times (int32 seconds since the start of the
+#                                                      service day, may exceed 24h, sorted, unique)
+#   line_segment_offsets[l]..[l+1]                  -> segment_pattern, segment_start, segment_departure: the line
+#                                                      reaches the stops of pattern segment_pattern from index
+#                                                      segment_start on, segment_departure seconds after the
+#                                                      pattern's first departure (one segment per merged platform)
+#   pattern_offsets[p]..[p+1]                       -> pattern_stop (int32 stop index, -1 outside the graph),
+#                                                      pattern_seconds (int32 arrival after the first departure)
+#   edge_stop, edge_seconds, line_edge_offsets      -> the to_stations of every line, expanded from the patterns on
+#                                                      first use (first segment wins for a stop reached twice)
+#   departure_service_offsets[d]..[d+1]             -> services of departure d (none: runs every day)
+#   service_name[v], service_days[v, day]           -> 1 when service v runs calendar_start + day
+#   transfer_offsets[s]..[s+1]                      -> transfer_stop (int32 stop index), transfer_seconds (int32
+#                                                      walking time) of footpaths to nearby stops
+#   string_offsets[i]..[i+1]                        -> utf-8 bytes of string i in strings
+ARRAY_NAMES = (
+    'stop_name', 'stop_id_offsets', 'stop_id_values',
+    'coord_offsets', 'coord_lat', 'coord_lon',
+    'stop_line_offsets', 'line_key', 'line_modes',
+    'line_departure_offsets', 'departure_times',
+    'line_segment_offsets', 'segment_pattern', 'segment_start', 'segment_departure',
+    'pattern_offsets', 'pattern_stop', 'pattern_seconds',
+    'departure_service_offsets', 'departure_service_values',
+    'service_name', 'service_days', 'calendar_start',
+    'transfer_offsets', 'transfer_stop', 'transfer_seconds',
+    'string_offsets', 'strings',
+)
+
+
+class BinaryGraph:
+    """Read-only router graph backed by (optionally memory-mapped) NumPy arrays."""
+
+    def __init__(self, arrays, meta=None):
+        for name in ARRAY_NAMES:
+            setattr(self, name, arrays[name])
+        self.meta = meta or {}
+        self.stop_names = [self.string(index) for index in self.stop_name.tolist()]
+        self.stop_index = {name: stop for stop, name in enumerate(self.stop_names)}
+        self._edge_arrays = None
+
+    @property
+    def stop_count(self):
+        return len(self.stop_name)
+
+    def string(self, index):
+        return bytes(self.strings[self.string_offsets[index]:self.string_offsets[index + 1]]).decode('utf-8')
+
+    def lines(self, stop):
+        return range(int(self.stop_line_offsets[stop]), int(self.stop_line_offsets[stop + 1]))
+
+    def departures(self, line):
+        return self.departure_times[self.line_departure_offsets[line]:self.line_departure_offsets[line + 1]]
+
+    def edges(self, line):
+        _, next_stops, travel_times = self.expand_segments(self.line_segment_offsets[line],
+                                                           self.line_segment_offsets[line + 1])
+        return next_stops, travel_times
+
+    def expand_segments(self, first, last):
+        """
+        (line, stop, travel seconds) of the edges of segments first..last-1, in to_stations order and
+        with only the first edge of a line to every stop.
+        """
+        patterns = np.asarray(self.segment_pattern[first:last], dtype=np.int64)
+        starts = np.asarray(self.pattern_offsets, dtype=np.int64)[patterns] + self.segment_start[first:last]
+        counts = np.maximum(np.asarray(self.pattern_offsets, dtype=np.int64)[patterns + 1] - starts, 0)
+        segments = np.repeat(np.arange(first, last, dtype=np.int64), counts)
+        positions = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum(), dtype=np.int64)
+        lines = np.searchsorted(self.line_segment_offsets, segments, side='right') - 1
+        stops = np.asarray(self.pattern_stop[positions], dtype=np.int64)
+        seconds = self.pattern_seconds[positions] - self.segment_departure[segments]
+        routable = np.flatnonzero(stops >= 0)
+        _, first_edges = np.unique(lines[routable] * self.stop_count + stops[routable], return_index=True)
+        kept = routable[np.sort(first_edges)]
+        return lines[kept], stops[kept].astype(np.int32), seconds[kept].astype(np.int32)
+
+    def _edges(self):
+        if self._edge_arrays is None:
+            lines, stops, seconds = self.expand_segments(0, len(self.segment_pattern))
+            offsets = np.concatenate(([0], np.cumsum(np.bincount(lines, minlength=len(self.line_key)))))
+            self._edge_arrays = offsets.astype(np.int32), stops, seconds
+        return self._edge_arrays
+
+    @property
+    def line_edge_offsets(self):
+        return self._edges()[0]
+
+    @property
+    def edge_stop(self):
+        return self._edges()[1]
+
+    @property
+    def edge_seconds(self):
+        return self._edges()[2]
+
+    def transfers(self, stop):
+        start, end = self.transfer_offsets[stop], self.transfer_offsets[stop + 1]
+        return self.transfer_stop[start:end], self.transfer_seconds[start:end]
+
+    def stop_data(self, stop):
+        """The stop in the dictionary layout produced by algorithm.load_connections."""
+        id_range = slice(self.stop_id_offsets[stop], self.stop_id_offsets[stop + 1])
+        coord_range = slice(self.coord_offsets[stop], self.coord_offsets[stop + 1])
+        connections = {}
+        for line in self.lines(stop):
+            next_stops, travel_times = self.edges(line)
+            connections[self.string(self.line_key[line])] = {
+                'departure_times': array('i', self.departures(line).tolist()),
+                'to_stations': {self.stop_names[next_stop]: travel_time
+                                for next_stop, travel_time in zip(next_stops.tolist(), travel_times.tolist())},
+                'modes': int(self.line_modes[line])
+            }
+        transfer_stops, walking_times = self.transfers(stop)
+        return {
+            'stop_name': self.stop_names[stop],
+            'latitudes': self.coord_lat[coord_range].tolist(),
+            'longitudes': self.coord_lon[coord_range].tolist(),
+            'stop_ids': [self.string(index) for index in self.stop_id_values[id_range].tolist()],
+            'connections': connections,
+            'transfers': {self.stop_names[next_stop]: walking_time
+                          for next_stop, walking_time in zip(transfer_stops.tolist(), walking_times.tolist())}
+        }
+
+    def connections(self):
+        return ConnectionsView(self)
+
+    def active_services(self, service_date):
+        """Boolean mask over services running on service_date."""
+        day = service_date.toordinal() - int(self.calendar_start[0]) if len(self.calendar_start) else -1
+        if day < 0 or day >= self.service_days.shape[1]:
+            return np.zeros(len(self.service_name), dtype=bool)
+        return self.service_days[:, day].astype(bool)
+
+    def for_date(self, service_date):
+        """
+        Timetable partition for one service day: the same graph with only the departures whose
+        service runs on service_date (departures without services are always kept).
+        """
+        if isinstance(service_date, str):
+            service_date = datetime.strptime(service_date, "%Y-%m-%d").date()
+        active = self.active_services(service_date)
+        departure_count = len(self.departure_times)
+        service_counts = np.diff(self.departure_service_offsets)
+        departure_of_value = np.repeat(np.arange(departure_count), service_counts)
+        active_counts = np.bincount(departure_of_value, weights=active[self.departure_service_values],
+                                    minlength=departure_count)
+        keep = (service_counts == 0) | (active_counts > 0)
+
+        line_of_departure = np.repeat(np.arange(len(self.line_key)), np.diff(self.line_departure_offsets))
+        kept_per_line = np.bincount(line_of_departure[keep], minlength=len(self.line_key))
+        arrays = {name: getattr(self, name) for name in ARRAY_NAMES}
+        arrays['departure_times'] = self.departure_times[keep]
+        arrays['line_departure_offsets'] = np.concatenate(([0], np.cumsum(kept_per_line))).astype(np.int32)
+        # The partition is already filtered, so its departures carry no services any more
+        arrays['departure_service_offsets'] = np.zeros(int(keep.sum()) + 1, dtype=np.int32)
+        arrays['departure_service_values'] = np.zeros(0, dtype=np.int32)
+        partition = BinaryGraph(arrays, dict(self.meta, service_date=service_date.isoformat()))
+        # The lines and their stops stay the same, only departures are dropped
+        partition._edge_arrays = self._edge_arrays
+        return partition
+
+
+class ConnectionsView(Mapping):
+    """
+    Dictionary-compatible view of a BinaryGraph for code written against load_connections.
+    Stops are materialized on first access only.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self._stops = {}
+
+    def __getitem__(self, name):
+        if name not in self._stops:
+            self._stops[name] = self.graph.stop_data(self.graph.stop_index[name])
+        return self._stops[name]
+
+    def __contains__(self, name):
+        return name in self.graph.stop_index
+
+    def __iter__(self):
+        return iter(self.graph.stop_names)
+
+    def __len__(self):
+        return self.graph.stop_count
+
+
+def build_binary_graph(connections, calendar=None):
+    """
+    Converts the output of algorithm.load_connections into a BinaryGraph. calendar is the
+    service calendar of the build ({service key: [YYYYMMDD, ...]}).
+    """
+    strings = {}
+    calendar = calendar or {}
+    service_index = {service: index for index, service in enumerate(calendar)}
+
+    def intern(value):
+        return strings.setdefault(value, len(strings))
+
+    stop_names = list(connections)
+    stop_index = {name: stop for stop, name in enumerate(stop_names)}
+    stop_of_id = {str(stop_id): stop_index[name] for name in stop_names for stop_id in connections[name]['stop_ids']}
+    arrays = {name: [] for name in ARRAY_NAMES}
+    for offsets in ('stop_id_offsets', 'coord_offsets', 'stop_line_offsets', 'line_departure_offsets',
+                    'line_segment_offsets', 'pattern_offsets', 'departure_service_offsets', 'transfer_offsets'):
+        arrays[offsets].append(0)
+    pattern_index = {}
+
+    def add_pattern(stops, seconds):
+        arrays['pattern_stop'].extend(stops)
+        arrays['pattern_seconds'].extend(seconds)
+        arrays['pattern_offsets'].append(len(arrays['pattern_stop']))
+        return len(arrays['pattern_offsets']) - 2
+
+    def trip_pattern(pattern):
+        if id(pattern) not in pattern_index:
+            # A stop repeated in the pattern is reached at its last arrival, as in pattern_to_stations
+            last_arrival = dict(zip(pattern['stops'], pattern['arrivals']))
+            pattern_index[id(pattern)] = add_pattern([stop_of_id.get(str(stop_id), -1) for stop_id in pattern['stops']],
+                                                     [last_arrival[stop_id] for stop_id in pattern['stops']])
+        return pattern_index[id(pattern)]
+
+    for name in stop_names:
+        stop_data = connections[name]
+        arrays['stop_name'].append(intern(name))
+        arrays['stop_id_values'].extend(intern(str(stop_id)) for stop_id in stop_data['stop_ids'])
+        arrays['stop_id_offsets'].append(len(arrays['stop_id_values']))
+        arrays['coord_lat'].extend(stop_data['latitudes'])
+        arrays['coord_lon'].extend(stop_data['longitudes'])
+        arrays['coord_offsets'].append(len(arrays['coord_lat']))
+
+        for line_id, line_data in stop_data['connections'].items():
+            arrays['line_key'].append(intern(str(line_id)))
+            arrays['line_modes'].append(line_data.get('modes', line_mode_bits(line_id)))
+            # Service sets per departure second; None marks a departure running every day
+            services_by_time = {}
+            services = line_data.get('departure_services') or [[] for _ in line_data['departure_times']]
+            for seconds, time_services in zip(line_data['departure_times'], services):
+                known = {service_index[service] for service in time_services if service in service_index}
+                if not time_services or seconds in services_by_time and services_by_time[seconds] is None:
+                    services_by_time[seconds] = None
+                else:
+                    services_by_time[seconds] = services_by_time.get(seconds, set()) | known
+            for seconds in sorted(services_by_time):
+                arrays['departure_times'].append(seconds)
+                arrays['departure_service_values'].extend(sorted(services_by_time[seconds] or ()))
+                arrays['departure_service_offsets'].append(len(arrays['departure_service_values']))
+            arrays['line_departure_offsets'].append(len(arrays['departure_times']))
+            # Edges to stops that never appear as a departure stop cannot be routed through
+            if 'segments' in line_data:
+                for pattern, start, departure in line_data['segments']:
+                    arrays['segment_pattern'].append(trip_pattern(pattern))
+                    arrays['segment_start'].append(start)
+                    arrays['segment_departure'].append(departure)
+            else:
+                # Connections without trip patterns: the line's to_stations become a pattern of their own
+                to_stations = line_data['to_stations']
+                arrays['segment_pattern'].append(add_pattern([stop_index.get(next_stop, -1) for next_stop in to_stations],
+                                                             list(to_stations.values())))
+                arrays['segment_start'].append(0)
+                arrays['segment_departure'].append(0)
+            arrays['line_segment_offsets'].append(len(arrays['segment_pattern']))
+        arrays['stop_line_offsets'].append(len(arrays['line_key']))
+        # Footpaths computed by load_connections (footpaths.add_transfers)
+        for next_stop, walking_time in stop_data.get('transfers', {}).items():
+            if next_stop in stop_index:
+                arrays['transfer_stop'].append(stop_index[next_stop])
+                arrays['transfer_seconds'].append(walking_time)
+        arrays['transfer_offsets'].append(len(arrays['transfer_stop']))
+
+    arrays['service_name'] = [intern(service) for service in calendar]
+    all_dates = sorted({date_key for dates in calendar.values() for date_key in dates})
+    if all_dates:
+        first_day = datetime.strptime(all_dates[0], '%Y%m%d').date().toordinal()
+        day_count = datetime.strptime(all_dates[-1], '%Y%m%d').date().toordinal() - first_day + 1
+        arrays['calendar_start'] = [first_day]
+    else:
+        day_count = 0
+    arrays['service_days'] = np.zeros((len(calendar), day_count), dtype=np.uint8)
+    for service, dates in calendar.items():
+        for date_key in dates:
+            arrays['service_days'][service_index[service],
+                                   datetime.strptime(date_key, '%Y%m%d').date().toordinal() - first_day] = 1
+
+    encoded = [value.encode('utf-8') for value in strings]
+    arrays['string_offsets'] = np.concatenate(([0], np.cumsum([len(value) for value in encoded]))).astype(np.int64)
+    arrays['strings'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+    dtypes = {'coord_lat': np.float64, 'coord_lon': np.float64, 'string_offsets': np.int64, 'strings': np.uint8,
+              'service_days': np.uint8, 'calendar_start': np.int64, 'line_modes': np.uint16}
+    for name in ARRAY_NAMES:
+        arrays[name] = np.asarray(arrays[name], dtype=dtypes.get(name, np.int32))
+    return BinaryGraph(arrays)
+
+
+def write_binary_graph(graph, directory):
+    """Writes one .npy file per array plus meta.json; load_binary_graph memory-maps them."""
+    os.makedirs(directory, exist_ok=True)
+    # Arrays of an older layout would only take space
+    for file_name in os.listdir(directory):
+        if file_name.endswith('.npy') and file_name[:-len('.npy')] not in ARRAY_NAMES:
+            os.remove(os.path.join(directory, file_name))
+    content_hash = hashlib.sha256()
+    for name in ARRAY_NAMES:
+        array = np.ascontiguousarray(getattr(graph, name))
+        np.save(os.path.join(directory, f"{name}.npy"), array)
+        content_hash.update(name.encode('utf-8'))
+        content_hash.update(array.tobytes())
+
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'stops': int(graph.stop_count),
+        'lines': int(len(graph.line_key)),
+        'departures': int(len(graph.departure_times)),
+        'patterns': int(len(graph.pattern_offsets) - 1),
+        'edges': int(len(graph.edge_stop)),
+        'transfers': int(len(graph.transfer_stop)),
+        'content_hash': content_hash.hexdigest(),
+    }
+    with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=4)
+    graph.meta = meta
+    return meta
+
+
+def load_binary_graph(directory, mmap=True):
+    with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported graph format version {meta.get('format_version')} in {directory}, "
+                         f"expected {FORMAT_VERSION}. Rebuild the graph.")
+
+    arrays = {
+        name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r' if mmap else None)
+        for name in ARRAY_NAMES
+    }
+    return BinaryGraph(arrays, meta)
+
+
+if __name__ == "__main__":
+    from algorithm import load_connections, load_calendar
+    from footpaths import TRANSFER_RADIUS
+    from stop_clusters import CLUSTER_RADIUS, CLUSTERS_FILE, connections_clusters, save_stop_clusters
+
+    parser = argparse.ArgumentParser(description="Convert a merged connections JSON file into the binary graph format.")
+    parser.add_argument("input_file", help="merged connections JSON, e.g. merged_connections.json")
+    parser.add_argument("output_directory", help="graph directory, e.g. merged_connections.graph")
+    parser.add_argument("--calendar", help="service calendar written by the build, e.g. merged_calendar.json")
+    parser.add_argument("--transfer-radius", type=float, default=TRANSFER_RADIUS,
+                        help=f"footpaths between stops closer than this many metres (default {TRANSFER_RADIUS}, 0 disables)")
+    parser.add_argument("--cluster-radius", type=float, default=CLUSTER_RADIUS,
+                        help=f"platforms of one name up to this many metres apart become one stop (default {CLUSTER_RADIUS})")
+    args = parser.parse_args()
+
+    calendar = load_calendar(args.calendar) if args.calendar else None
+    # The platform clusters are computed here, once, and saved next to the input file
+    connections = load_connections(args.input_file, transfer_radius=args.transfer_radius,
+                                   cluster_radius=args.cluster_radius)
+    meta = write_binary_graph(build_binary_graph(connections, calendar), args.output_directory)
+    save_stop_clusters(connections_clusters(connections), os.path.join(args.output_directory, CLUSTERS_FILE),
+                       args.cluster_radius)
+    print(f"Binary graph saved to {args.output_directory}: {meta['stops']} stops, {meta['lines']} lines, "
+          f"{meta['departures']} departures, {meta['patterns']} patterns ({meta['edges']} edges), {meta['transfers']} transfers")
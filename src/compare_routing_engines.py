@@ -0,0 +1,150 @@
+import os
+import time
+import random
+import argparse
+from heapq import heappop, heappush
+from algorithm import load_connections, ROUTING_ALGORITHMS
+from raptor import raptor_arrive_by_times, raptor_travel_time
+from binary_graph import load_binary_graph
+from modes import line_allowed, mode_mask
+from timetable import enable_minute_tables
+
+
+def reference_dijkstra_all_times(connections, start, departure_time, modes=None):
+    """dijkstra_all_times with a linear scan over departure_times, kept as the parity reference."""
+    times = {stop_id: float('inf') for stop_id in connections}
+    times[start] = 0
+    visited = set()
+    pq = [(0, start)]
+
+    while pq:
+        current_time, current_stop = heappop(pq)
+        if current_stop in visited:
+            continue
+        visited.add(current_stop)
+        current_clock = departure_time + current_time
+
+        for next_stop, walking_time in connections[current_stop].get('transfers', {}).items():
+            if next_stop in times and current_time + walking_time < times[next_stop]:
+                times[next_stop] = current_time + walking_time
+                heappush(pq, (current_time + walking_time, next_stop))
+
+        for line_id, line_data in connections[current_stop]['connections'].items():
+            if not line_allowed(line_data['modes'], modes):
+                continue
+            scheduled_departure = min((dep_time for dep_time in line_data['departure_times'] if dep_time >= current_clock),
+                                      default=None)
+            if scheduled_departure is None:
+                continue
+            wait_time = scheduled_departure - current_clock
+            for next_stop, travel_time in line_data['to_stations'].items():
+                if next_stop not in times:
+                    continue
+                total_travel_time = current_time + wait_time + travel_time
+                if total_travel_time < times[next_stop]:
+                    times[next_stop] = total_travel_time
+                    heappush(pq, (total_travel_time, next_stop))
+
+    return times
+
+
+def compare(connections, queries=20, seed=0, max_travel_time=None, modes=None):
+    """
+    Runs every engine of ROUTING_ALGORITHMS against the reference on random origins and start times.
+    With max_travel_time the engines must return the reference times with everything above the cutoff unreachable;
+    with a mode mask every engine and the reference skip the lines outside it.
+    """
+    rng = random.Random(seed)
+    stop_names = list(connections)
+    cases = [(rng.choice(stop_names), rng.randint(4 * 3600, 23 * 3600)) for _ in range(queries)]
+
+    expected, reference_seconds = [], 0.0
+    for start, departure_time in cases:
+        started = time.perf_counter()
+        reference = reference_dijkstra_all_times(connections, start, departure_time, modes)
+        reference_seconds += time.perf_counter() - started
+        if max_travel_time is not None:
+            reference = {stop: travel_time if travel_time <= max_travel_time else float('inf')
+                         for stop, travel_time in reference.items()}
+        expected.append(reference)
+    print(f"reference: {reference_seconds / queries * 1000:.1f} ms per query")
+
+    ok = True
+    for name, engine in ROUTING_ALGORITHMS.items():
+        engine(connections, *cases[0], modes=modes)  # Engines with precomputed arrays build them on the first call
+        mismatches, seconds = 0, 0.0
+        for (start, departure_time), reference in zip(cases, expected):
+            started = time.perf_counter()
+            times = engine(connections, start, departure_time, max_travel_time=max_travel_time, modes=modes)
+            seconds += time.perf_counter() - started
+            mismatches += sum(times[stop] != travel_time for stop, travel_time in reference.items())
+        print(f"{name}: {seconds / queries * 1000:.1f} ms per query, {mismatches} mismatching stops")
+        ok = ok and mismatches == 0
+
+    # Target-pruned single-destination queries must match the reference at every sampled target
+    mismatches, seconds, targets = 0, 0.0, 0
+    for (start, departure_time), reference in zip(cases, expected):
+        for target in rng.sample(stop_names, min(5, len(stop_names))):
+            started = time.perf_counter()
+            travel_time = raptor_travel_time(connections, start, target, departure_time, max_travel_time=max_travel_time,
+                                             modes=modes)
+            seconds += time.perf_counter() - started
+            mismatches += travel_time != reference[target]
+            targets += 1
+    print(f"raptor point-to-point: {seconds / targets * 1000:.1f} ms per query, {mismatches} mismatching targets")
+    return ok and mismatches == 0
+
+
+def compare_arrive_by(connections, queries=20, seed=0, max_travel_time=None, samples=10, modes=None):
+    """
+    Checks raptor_arrive_by_times against forward searches on a sample of stops: leaving a stop at its
+    latest departure reaches the destination in time and leaving one second later does not.
+    """
+    rng = random.Random(seed)
+    stop_names = list(connections)
+    def forward(connections, start, departure_time):
+        return ROUTING_ALGORITHMS["raptor"](connections, start, departure_time, modes=modes)
+
+    mismatches, seconds = 0, 0.0
+    for _ in range(queries):
+        target, arrival_time = rng.choice(stop_names), rng.randint(5 * 3600, 24 * 3600)
+        started = time.perf_counter()
+        times = raptor_arrive_by_times(connections, target, arrival_time, max_travel_time=max_travel_time, modes=modes)
+        seconds += time.perf_counter() - started
+        for stop in rng.sample(stop_names, min(samples, len(stop_names))):
+            if times[stop] == float('inf'):
+                # Even leaving as early as the cutoff allows misses the arrival time
+                departure_time = 0 if max_travel_time is None else arrival_time - max_travel_time
+                mismatches += departure_time + forward(connections, stop, departure_time)[target] <= arrival_time
+                continue
+            departure_time = arrival_time - times[stop]
+            in_time = departure_time + forward(connections, stop, departure_time)[target] <= arrival_time
+            later = departure_time + 1 + forward(connections, stop, departure_time + 1)[target] <= arrival_time
+            mismatches += not in_time or later or (max_travel_time is not None and times[stop] > max_travel_time)
+    print(f"raptor arrive-by: {seconds / queries * 1000:.1f} ms per query, {mismatches} mismatching stops")
+    return mismatches == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that every routing engine returns the same times as the reference Dijkstra.")
+    parser.add_argument("connections", help="merged_connections.json or a binary graph directory")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-travel-time", type=int, help="cutoff in minutes, e.g. 90")
+    parser.add_argument("--modes", nargs="+", help="only lines of these modes, e.g. bus tram")
+    parser.add_argument("--operators", nargs="+", help="only lines of these operators, e.g. ztm skm")
+    parser.add_argument("--minute-tables", type=int, metavar="MIN_DEPARTURES",
+                        help="route with minute tables for lines with at least this many departures")
+    args = parser.parse_args()
+
+    if args.minute_tables is not None:
+        enable_minute_tables(args.minute_tables)
+    if os.path.isdir(args.connections):
+        connections = load_binary_graph(args.connections).connections()
+    else:
+        connections = load_connections(args.connections)
+    max_travel_time = args.max_travel_time * 60 if args.max_travel_time else None
+    modes = mode_mask(args.modes, args.operators) if args.modes or args.operators else None
+    forward_ok = compare(connections, args.queries, args.seed, max_travel_time, modes)
+    if not (compare_arrive_by(connections, args.queries, args.seed, max_travel_time, modes=modes) and forward_ok):
+        raise SystemExit(1)
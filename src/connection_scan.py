@@ -0,0 +1,123 @@
+import numpy as np
+from binary_graph import ConnectionsView, build_binary_graph
+from footpaths import relax_transfers
+from object_cache import ObjectCache
+
+
+class ConnectionScan:
+    """
+    Connection scan over the router graph. The connections are the departures of every line from
+    every stop, kept in NumPy arrays sorted by line and departure time; taking one relaxes all of
+    the line's to_stations. A line has the same travel times for each of its departures, so only
+    the first departure caught at a stop can improve anything. The scan works in passes instead
+    of one connection at a time: every pass looks up, with a single searchsorted, the first
+    departure of each line leaving the stops improved by the previous pass, so the number of
+    passes is bounded by the rides of a journey rather than by the minutes of the day.
+    """
+
+    def __init__(self, stop_names, line_stop, line_edge_offsets, edge_stop, edge_travel, departure, departure_line,
+                 transfer_offsets, transfer_stop, transfer_seconds, line_modes):
+        self.stop_names = stop_names
+        self.stop_index = {name: stop for stop, name in enumerate(stop_names)}
+        self.line_stop = line_stop.astype(np.int64)
+        self.line_edge_offsets = line_edge_offsets.astype(np.int64)
+        self.line_edge_counts = np.diff(self.line_edge_offsets)
+        self.edge_stop = edge_stop.astype(np.int64)
+        self.edge_travel = edge_travel.astype(np.int64)
+        self.transfer_offsets = transfer_offsets.astype(np.int64)
+        self.transfer_stop = transfer_stop.astype(np.int64)
+        self.transfer_seconds = transfer_seconds.astype(np.int64)
+        self.line_modes = line_modes.astype(np.int64)
+
+        # Lines are numbered stop by stop, so the lines of stop s are stop_line_offsets[s]..[s+1]
+        self.stop_line_offsets = np.concatenate(
+            ([0], np.cumsum(np.bincount(self.line_stop, minlength=len(stop_names))))).astype(np.int64)
+        order = np.lexsort((departure, departure_line))
+        self.departure = departure[order].astype(np.int64)
+        departure_line = departure_line[order].astype(np.int64)
+        # (line, time) keys are sorted over the whole array, so one searchsorted finds the next
+        # departure of many lines at once
+        self.departure_keys = (departure_line << 32) | self.departure
+        self.line_departure_end = np.searchsorted(departure_line, np.arange(1, len(self.line_stop) + 1))
+
+    @property
+    def connection_count(self):
+        return len(self.departure)
+
+    def _relax_lines(self, earliest, lines, departures, limit):
+        """
+        Applies the to_stations of lines taken at departures and the footpaths from the stops they improve,
+        up to the limit clock; returns the improved stops.
+        """
+        counts = self.line_edge_counts[lines]
+        first_edge = np.repeat(self.line_edge_offsets[lines] - (np.cumsum(counts) - counts), counts)
+        edges = first_edge + np.arange(counts.sum())
+        arrivals = np.repeat(departures, counts) + self.edge_travel[edges]
+        targets = self.edge_stop[edges]
+        better = (arrivals < earliest[targets]) & (arrivals <= limit)
+        np.minimum.at(earliest, targets[better], arrivals[better])
+        improved = targets[better]
+        return np.concatenate((improved, self._walk(earliest, improved, limit)))
+
+    def _walk(self, earliest, improved, limit):
+        return relax_transfers(earliest, np.unique(improved), self.transfer_offsets, self.transfer_stop,
+                               self.transfer_seconds, limit)
+
+    def _lines_of(self, stops, allowed):
+        counts = self.stop_line_offsets[stops + 1] - self.stop_line_offsets[stops]
+        lines = np.repeat(self.stop_line_offsets[stops] - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+        return lines if allowed is None else lines[allowed[lines]]
+
+    def earliest_arrivals(self, start, departure_time, max_travel_time=None, modes=None):
+        """
+        Earliest arrival clock (seconds since the start of the service day) at every stop, -1 if unreachable
+        or reachable only after more than max_travel_time seconds; the scan stops at that cutoff.
+        Lines outside the mode mask modes are never taken.
+        """
+        unreachable = np.iinfo(np.int64).max
+        limit = unreachable - 1 if max_travel_time is None else departure_time + max_travel_time
+        earliest = np.full(len(self.stop_names), unreachable, dtype=np.int64)
+        earliest[self.stop_index[start]] = departure_time
+        allowed = None if modes is None else (self.line_modes & modes) == self.line_modes
+        improved = np.concatenate(([self.stop_index[start]], self._walk(earliest, np.array([self.stop_index[start]]), limit)))
+
+        # Label-correcting passes: a stop whose arrival improved is scanned again from its new arrival
+        while len(improved):
+            lines = self._lines_of(np.unique(improved), allowed)
+            next_departure = np.searchsorted(self.departure_keys, (lines << 32) | earliest[self.line_stop[lines]])
+            caught = next_departure < self.line_departure_end[lines]
+            departures = self.departure[next_departure[caught]]
+            in_time = departures <= limit
+            improved = self._relax_lines(earliest, lines[caught][in_time], departures[in_time], limit)
+
+        return np.where(earliest == unreachable, -1, earliest)
+
+    def all_times(self, start, departure_time, max_travel_time=None, modes=None):
+        """Same result as algorithm.dijkstra_all_times: {stop: seconds after departure_time or inf}."""
+        earliest = self.earliest_arrivals(start, departure_time, max_travel_time, modes).tolist()
+        return {name: float('inf') if arrival < 0 else arrival - departure_time
+                for name, arrival in zip(self.stop_names, earliest)}
+
+
+def build_connection_scan(connections):
+    """Builds the scan arrays from a binary graph view or the output of load_connections."""
+    graph = connections.graph if isinstance(connections, ConnectionsView) else build_binary_graph(connections)
+    line_count = len(graph.line_key)
+    return ConnectionScan(
+        graph.stop_names,
+        np.repeat(np.arange(graph.stop_count), np.diff(graph.stop_line_offsets)),
+        np.asarray(graph.line_edge_offsets), np.asarray(graph.edge_stop), np.asarray(graph.edge_seconds),
+        np.asarray(graph.departure_times), np.repeat(np.arange(line_count), np.diff(graph.line_departure_offsets)),
+        np.asarray(graph.transfer_offsets), np.asarray(graph.transfer_stop), np.asarray(graph.transfer_seconds),
+        np.asarray(graph.line_modes)
+    )
+
+
+# Scan arrays of the last few connections objects (a loaded graph or one of its date partitions)
+SCAN_CACHE_SIZE = 4
+_scans = ObjectCache(SCAN_CACHE_SIZE)
+
+
+def csa_all_times(connections, start, departure_time, max_travel_time=None, modes=None):
+    scan = _scans.get((connections,), lambda: build_connection_scan(connections))
+    return scan.all_times(start, departure_time, max_travel_time, modes)
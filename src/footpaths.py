@@ -0,0 +1,97 @@
+import math
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Footpath transfers between different router stops (platforms clustered by
+# stop_clusters.py already share one stop and need no footpath)
+TRANSFER_RADIUS = 250  # metres
+WALKING_SPEED = 1.2  # metres per second
+MIN_TRANSFER_SECONDS = 60
+EARTH_RADIUS = 6371000
+
+
+def project_coordinates(latitudes, longitudes):
+    """Equirectangular projection to metres around the mean latitude, exact enough for a few hundred metres."""
+    latitudes = np.radians(np.asarray(latitudes, dtype=np.float64))
+    longitudes = np.radians(np.asarray(longitudes, dtype=np.float64))
+    scale = math.cos(float(latitudes.mean())) if len(latitudes) else 1.0
+    return np.column_stack((EARTH_RADIUS * longitudes * scale, EARTH_RADIUS * latitudes))
+
+
+def transfer_seconds(distance):
+    return np.maximum(np.ceil(distance / WALKING_SPEED), MIN_TRANSFER_SECONDS).astype(np.int32)
+
+
+def build_transfers(coord_offsets, latitudes, longitudes, radius=TRANSFER_RADIUS):
+    """
+    Transfer table for all stop pairs whose closest coordinates are within radius metres, found
+    with a KD-tree instead of comparing every pair. Stops are given in CSR form (coordinates of stop s
+    are coord_offsets[s]..[s+1]). Returns CSR arrays (transfer_offsets, transfer_stop, transfer_seconds).
+    """
+    coord_offsets = np.asarray(coord_offsets, dtype=np.int64)
+    stop_count = len(coord_offsets) - 1
+    coord_stop = np.repeat(np.arange(stop_count, dtype=np.int64), np.diff(coord_offsets))
+    points = project_coordinates(latitudes, longitudes)
+    pairs = cKDTree(points).query_pairs(radius, output_type='ndarray') if len(points) else np.zeros((0, 2), dtype=np.int64)
+
+    from_stop, to_stop = coord_stop[pairs[:, 0]], coord_stop[pairs[:, 1]]
+    distance = np.linalg.norm(points[pairs[:, 0]] - points[pairs[:, 1]], axis=1)
+    different = from_stop != to_stop
+    # Both directions, then the shortest distance per stop pair
+    from_stop, to_stop = (np.concatenate((from_stop[different], to_stop[different])),
+                          np.concatenate((to_stop[different], from_stop[different])))
+    distance = np.concatenate((distance[different], distance[different]))
+    order = np.lexsort((distance, to_stop, from_stop))
+    from_stop, to_stop, distance = from_stop[order], to_stop[order], distance[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (from_stop[1:] != from_stop[:-1]) | (to_stop[1:] != to_stop[:-1])
+    from_stop, to_stop, distance = from_stop[first], to_stop[first], distance[first]
+
+    transfer_offsets = np.concatenate(([0], np.cumsum(np.bincount(from_stop, minlength=stop_count)))).astype(np.int32)
+    return transfer_offsets, to_stop.astype(np.int32), transfer_seconds(distance)
+
+
+def add_transfers(connections, radius=TRANSFER_RADIUS):
+    """Stores {stop name: seconds} footpaths as 'transfers' of every stop of a load_connections result."""
+    stop_names = list(connections)
+    coord_offsets = np.concatenate(([0], np.cumsum([len(connections[name]['latitudes']) for name in stop_names])))
+    latitudes = [lat for name in stop_names for lat in connections[name]['latitudes']]
+    longitudes = [lon for name in stop_names for lon in connections[name]['longitudes']]
+    offsets, targets, seconds = build_transfers(coord_offsets, latitudes, longitudes, radius)
+    for stop, name in enumerate(stop_names):
+        transfer_range = slice(offsets[stop], offsets[stop + 1])
+        connections[name]['transfers'] = {stop_names[target]: walk for target, walk in
+                                          zip(targets[transfer_range].tolist(), seconds[transfer_range].tolist())}
+    return connections
+
+
+def stop_limit(limit, stops):
+    """limit is one clock for all stops or an array with a clock per stop."""
+    return limit[stops] if isinstance(limit, np.ndarray) else limit
+
+
+def relax_transfers(earliest, improved, transfer_offsets, transfer_stop, walking_seconds, limit, walked_from=None):
+    """
+    Walks from the improved stops (repeatedly, footpaths may be chained) and lowers earliest in place
+    up to limit (see stop_limit).
+    Returns every stop improved by walking; walked_from, when given, gets the stop each of them was reached from.
+    """
+    walked = []
+    while len(improved):
+        # Most stops have no footpaths at all
+        counts = transfer_offsets[improved + 1] - transfer_offsets[improved]
+        improved, counts = improved[counts > 0], counts[counts > 0]
+        if not len(improved):
+            break
+        first = np.repeat(transfer_offsets[improved] - (np.cumsum(counts) - counts), counts)
+        transfers = first + np.arange(counts.sum())
+        arrivals = np.repeat(earliest[improved], counts) + walking_seconds[transfers]
+        targets = transfer_stop[transfers]
+        better = (arrivals < earliest[targets]) & (arrivals <= stop_limit(limit, targets))
+        np.minimum.at(earliest, targets[better], arrivals[better])
+        if walked_from is not None:
+            won = better & (arrivals == earliest[targets])
+            walked_from[targets[won]] = np.repeat(improved, counts)[won]
+        improved = np.unique(targets[better])
+        walked.append(improved)
+    return np.unique(np.concatenate(walked)) if walked else np.zeros(0, dtype=np.int64)
@@ -1,3 +1,4 @@
+import sys
 import json
 import numpy as np
 import pandas as pd
@@ -6,7 +7,17 @@ from scipy.interpolate import griddata
 from scipy.ndimage import gaussian_filter
 import matplotlib.colors as mcolors
 
-def generate_heatmap(margin_size=0.02, gaussian_sigma=2, max_display_time=90):  # max_display_time w minutach
+# Górna granica skali w minutach; serwer przekazuje ją też do wyszukiwania jako max_travel_time
+MAX_DISPLAY_TIME = 90
+
+# Pola czasu z travel_data.json: travel_time lub, dla zapytań z oknem odjazdów,
+# min_travel_time / median_travel_time / p90_travel_time
+TIME_FIELDS = ('travel_time', 'min_travel_time', 'median_travel_time', 'p90_travel_time')
+
+# Plik wczytywany przez frontend; serwer trzyma jego kopie w pamięci podręcznej wyników
+HEATMAP_SVG_PATH = '../app/public/heatmap.svg'
+
+def generate_heatmap(margin_size=0.02, gaussian_sigma=2, max_display_time=MAX_DISPLAY_TIME, time_field='travel_time'):  # max_display_time w minutach
     # Zmienna kontrolująca wyświetlanie przystanków
     show_stops = True
 
@@ -16,10 +27,12 @@ def generate_heatmap(margin_size=0.02, gaussian_sigma=2, max_display_time=90):
     with open('travel_data.json', 'r', encoding='utf-8') as f:
         travel_data = json.load(f)
 
-    # Odczyt współrzędnych i czasów podróży z nowej struktury JSON
-    latitudes = [travel_data['start_station']['lat']] + [station['lat'] for station in travel_data['other_stations']]
-    longitudes = [travel_data['start_station']['lon']] + [station['lon'] for station in travel_data['other_stations']]
-    times = [travel_data['start_station']['travel_time']] + [station['travel_time'] for station in travel_data['other_stations']]
+    # Odczyt współrzędnych i czasów podróży z nowej struktury JSON; przystanki bez wybranego pola
+    # (np. p90 nieosiągalne w części minut okna) są pomijane
+    stations = [station for station in travel_data['other_stations'] if time_field in station]
+    latitudes = [travel_data['start_station']['lat']] + [station['lat'] for station in stations]
+    longitudes = [travel_data['start_station']['lon']] + [station['lon'] for station in stations]
+    times = [0] + [station[time_field] for station in stations]
 
     # Upewnij się, że długości i szerokości są zgodne
     if len(latitudes) != len(longitudes) or len(latitudes) != len(times):
@@ -84,13 +97,17 @@ def generate_heatmap(margin_size=0.02, gaussian_sigma=2, max_display_time=90):
         # Rysowanie wszystkich przystanków jako czarne kropki
         ax.scatter(df['x'], df['y'], c='black', s=0.2, marker='o', label="Przystanki", linewidths=0)
 
-        # Wyróżnienie przystanku początkowego jako większej, czerwonej kropki
-        ax.scatter(df['x'].iloc[0], df['y'].iloc[0], c='red', s=2, marker='o', label="Przystanek początkowy")
+        # Wyróżnienie przystanku początkowego (docelowego przy wyszukiwaniu wstecz) jako większej, czerwonej kropki
+        start_label = "Przystanek docelowy" if travel_data.get('arrive_by') else "Przystanek początkowy"
+        ax.scatter(df['x'].iloc[0], df['y'].iloc[0], c='red', s=2, marker='o', label=start_label)
         ax.legend()
 
     # Dodanie paska kolorów (colorbar)
     cbar = plt.colorbar(contour_plot, ax=ax, orientation='vertical', shrink=0.8, pad=0.02)
-    cbar.set_label('Czas podróży (minuty)', fontsize=12)  # Opis skali
+    labels = {'min_travel_time': ' - minimum', 'median_travel_time': ' - mediana', 'p90_travel_time': ' - 90. percentyl'}
+    # Przy wyszukiwaniu wstecz czas to wyprzedzenie, z jakim trzeba wyjechać z przystanku
+    title = 'Czas do przyjazdu (minuty)' if travel_data.get('arrive_by') else 'Czas podróży (minuty)'
+    cbar.set_label(f'{title}{labels.get(time_field, "")}', fontsize=12)  # Opis skali
     cbar.ax.tick_params(labelsize=10)  # Rozmiar etykiet
 
     # Usunięcie osi
@@ -98,7 +115,11 @@ def generate_heatmap(margin_size=0.02, gaussian_sigma=2, max_display_time=90):
     ax.set_yticks([])
 
     # Zapis wykresu jako plik SVG
-    plt.savefig('../app/public/heatmap.svg', format='svg', bbox_inches='tight', pad_inches=0)
+    plt.savefig(HEATMAP_SVG_PATH, format='svg', bbox_inches='tight', pad_inches=0)
 
 if __name__ == "__main__":
-    generate_heatmap(max_display_time=90)  # Przykładowo ustawiamy 90 minut
+    # Opcjonalny argument: pole czasu do narysowania, np. p90_travel_time
+    time_field = sys.argv[1] if len(sys.argv) > 1 else 'travel_time'
+    if time_field not in TIME_FIELDS:
+        raise ValueError(f"Nieznane pole czasu {time_field}, dostępne: {', '.join(TIME_FIELDS)}")
+    generate_heatmap(max_display_time=MAX_DISPLAY_TIME, time_field=time_field)
@@ -1,9 +1,14 @@
 import requests
 import json
+import os
+import sys
 import pandas as pd
 from google.transit import gtfs_realtime_pb2
 from tqdm import tqdm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from trip_patterns import is_pattern_data, expand_patterns, namespaced_id
+
 
 def fetch_gtfs_rt(url):
     response = requests.get(url)
@@ -81,29 +86,35 @@ def find_previous_stop_with_delay(gtfs_rt_full_data, stop_times_lookup):
                     "trip_id": trip_id,
                     "connection_id": trip_id.split("_")[1],
                     "previous_stop_id": previous_stop_data["stop_id"],
-                    "delay_minutes": delay_seconds // 60,
+                    "delay_seconds": delay_seconds,
                     "delayed_stop_id": delayed_stop_id
                 })
 
     return processed_delays
 
 
-def update_json_with_delays(original_json, processed_delays):
+def update_json_with_delays(original_json, processed_delays, operator=None):
+    """operator: prefix of the ids in a merged file (e.g. "ztm"), None for a single operator's file."""
     print(processed_delays)
     for delay_info in processed_delays:
         previous_stop_id = str(delay_info["previous_stop_id"])
         connection_id = str(delay_info["connection_id"])
-        delay_minutes = delay_info["delay_minutes"]
+        delay_seconds = delay_info["delay_seconds"]
         delay_stop = str(delay_info["delayed_stop_id"])
+        if operator:
+            previous_stop_id = namespaced_id(operator, previous_stop_id)
+            connection_id = namespaced_id(operator, connection_id)
+            delay_stop = namespaced_id(operator, delay_stop)
 
         if previous_stop_id in original_json:
             connections = original_json[previous_stop_id].get("connections", {})
             if connection_id in connections:
                 to_station = connections[connection_id].get("to_stations", {})
                 if delay_stop in to_station:
-                    to_station[delay_stop] += delay_minutes
+                    # Travel times are in seconds, like the delays reported by GTFS-RT
+                    to_station[delay_stop] += delay_seconds
                     print(
-                        f"Updated connection_id {connection_id} at stop_id {previous_stop_id} with delay {delay_minutes} minutes on stop:{delay_stop}")
+                        f"Updated connection_id {connection_id} at stop_id {previous_stop_id} with delay {delay_seconds} seconds on stop:{delay_stop}")
                 if delay_stop not in to_station:
                     print(
                         f"Missing stop {delay_stop} in to_stations for connection_id {connection_id} at stop_id {previous_stop_id}")
@@ -133,8 +144,13 @@ def main():
 
         with open(merged_connections_file, "r", encoding="utf-8") as f:
             original_json = json.load(f)
+        # Delays are applied per stop and line, so shared trip patterns are expanded first
+        if is_pattern_data(original_json):
+            original_json = expand_patterns(original_json)
 
-        updated_json = update_json_with_delays(original_json, processed_delays)
+        # The feed is ZTM's; merged files prefix its ids with "ztm:"
+        operator = "ztm" if any(stop_data.get("operator") for stop_data in original_json.values()) else None
+        updated_json = update_json_with_delays(original_json, processed_delays, operator)
 
         save_to_json(updated_json, "updated_connections_with_delays.json")
     except Exception as e:
@@ -16,46 +16,57 @@ def calculate_travel_time(start_time, travel_time):
     end_dt = start_dt + travel_delta
     return end_dt.strftime("%H:%M:%S")
 
-# BFS to find the shortest path considering waiting times
+# BFS to find the shortest path considering waiting times. Instead of a copy of the path in every
+# queue entry, each reached stop keeps one predecessor label (previous stop, trip, departure, travel time)
+# and the legs are rebuilt only for the end stop, so memory stays linear in the number of stops
 def bfs(connections, start, end, departure_time):
-    queue = deque([(start, departure_time, [])])  # (current stop, departure time, path)
+    queue = deque([(start, departure_time)])  # (current stop, departure time)
     visited = {start: departure_time}  # Store visited stops with their latest departure times
+    predecessors = {}  # stop -> (previous stop, trip, scheduled departure, travel time)
 
     while queue:
-        current_stop, current_departure, path = queue.popleft()
-        current_path = path + [(current_stop, current_departure)]  # Update the path
+        current_stop, current_departure = queue.popleft()
 
         if current_stop == end:
-            return current_path  # Return the full path when the end is reached
+            return rebuild_legs(predecessors, start, end)
 
         # Explore neighbors
         for next_trip, next_info in connections[current_stop]['connections'].items():
-            for next_stop, travel_time in next_info['to_stations'].items():
-                # Get the list of scheduled departure times
-                departure_times = next_info['departure_times']
-
-                # Find the next available departure time after the current time
-                scheduled_departure = None
-                for dep_time in departure_times:
-                    if dep_time >= current_departure:
-                        scheduled_departure = dep_time
-                        break
+            # Find the next available departure time after the current time
+            scheduled_departure = None
+            for dep_time in next_info['departure_times']:
+                if dep_time >= current_departure:
+                    scheduled_departure = dep_time
+                    break
 
-                # If there's no valid scheduled departure time, continue to the next trip
-                if scheduled_departure is None:
-                    continue
+            # If there's no valid scheduled departure time, continue to the next trip
+            if scheduled_departure is None:
+                continue
 
+            for next_stop, travel_time in next_info['to_stations'].items():
                 # Calculate the arrival time based on the scheduled departure time
                 arrival_time = calculate_travel_time(scheduled_departure, travel_time)
 
                 # Check if the arrival time is valid and the next stop has not been visited or has a later departure time
-                if (arrival_time >= scheduled_departure and 
+                if (arrival_time >= scheduled_departure and
                     (next_stop not in visited or arrival_time < visited[next_stop])):
                     visited[next_stop] = arrival_time  # Record the arrival time at this stop
-                    queue.append((next_stop, arrival_time, current_path))  # Add next stop to the queue
+                    predecessors[next_stop] = (current_stop, next_trip, scheduled_departure, travel_time)
+                    queue.append((next_stop, arrival_time))  # Add next stop to the queue
 
     return None  # Return None if no path is found
 
+# Legs (from stop, to stop, trip, departure, travel time, arrival) from start to end
+def rebuild_legs(predecessors, start, end):
+    legs = []
+    stop = end
+    while stop != start:
+        previous_stop, trip, departure_time, travel_time = predecessors[stop]
+        legs.append((previous_stop, stop, trip, departure_time, travel_time,
+                     calculate_travel_time(departure_time, travel_time)))
+        stop = previous_stop
+    return legs[::-1]
+
 # Function to run the search when the button is pressed
 def find_route():
     start_station = start_station_var.get()
@@ -78,24 +89,11 @@ def find_route():
         result_text = "Route:\n"
         total_travel_time = 0
 
-        # Build the output string with travel times and arrival times
-        for i in range(len(route) - 1):
-            current_stop, departure_time = route[i]
-            next_stop, _ = route[i + 1]
-
-            # Fetch the travel time using the correct trip info
-            travel_time = None
-            for next_trip, next_info in connections[current_stop]['connections'].items():
-                if next_stop in next_info['to_stations']:
-                    travel_time = next_info['to_stations'][next_stop]
-                    break
-
-            if travel_time is not None:
-                arrival_time = calculate_travel_time(departure_time, travel_time)
-
-                result_text += f"{connections[current_stop]['stop_name']} -> {connections[next_stop]['stop_name']} " \
-                               f"(Departure: {departure_time}, Travel Time: {travel_time} mins, Arrival: {arrival_time})\n"
-                total_travel_time += travel_time
+        # The legs already carry the trip and travel time they were found with
+        for current_stop, next_stop, trip, departure_time, travel_time, arrival_time in route:
+            result_text += f"{connections[current_stop]['stop_name']} -> {connections[next_stop]['stop_name']} " \
+                           f"(Trip: {trip}, Departure: {departure_time}, Travel Time: {travel_time} mins, Arrival: {arrival_time})\n"
+            total_travel_time += travel_time
 
         result_text += f"\nTotal Travel Time: {total_travel_time} minutes"
         result_label.config(text=result_text)
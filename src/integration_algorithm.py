@@ -1,21 +1,119 @@
 import subprocess
 import os
+import hashlib
 from algorithm import *
-import generate_heatmap
+from binary_graph import load_binary_graph, ConnectionsView
+from result_cache import ResultCache
+from stop_index import stop_index
+from raptor import cached_raptor
+from timetable import enable_minute_tables, disable_minute_tables
+from generate_heatmap import MAX_DISPLAY_TIME, HEATMAP_SVG_PATH
 
 CONNCECTIONS_PATH = "merged_connections.json"
+GRAPH_PATH = "merged_connections.graph"
+CALENDAR_PATH = "merged_calendar.json"
+# Output of GTFS-RT.py; a change of this file invalidates cached results like a new graph does
+DELAYS_PATH = "updated_connections_with_delays.json"
+RESULT_CACHE_PATH = "result_cache"
+# Engine used for the heatmap queries, see ROUTING_ALGORITHMS in algorithm.py
+ROUTING_ALGORITHM = "raptor"
+# Per-minute next-departure tables for lines with at least this many departures, within this many MB
+# per router; None (the default) turns them off. When set, they are kept only if the startup report
+# measures them faster than the binary search they replace
+MINUTE_TABLE_MIN_DEPARTURES = None
+MINUTE_TABLE_BUDGET_MB = 8
 
-def run_algorithm(connections, start, time):
+def run_algorithm(connections, start, time, service_date=None, calendar=None, algorithm=ROUTING_ALGORITHM,
+                  max_transfers=None, window_minutes=None, time_field="travel_time", max_travel_time=None,
+                  arrive_by=False, modes=None):
     # subprocess.run(["python", "algorithm.py"], check=True)
     print("starting..")
-    starting_algorithm(connections, start, time)
-    run_heatmap()
+    cache = get_result_cache()
+    if cache is not None:
+        cache.set_version(data_version(connections))
+    if max_transfers is not None or arrive_by:
+        # Only the round-based router counts transfers and searches backwards
+        algorithm = "raptor"
+    svg_key = None
+    if cache is not None:
+        # The rendered map is cached under the key of the result plus the drawn field, so a repeated
+        # query neither routes nor starts the matplotlib subprocess
+        start_time = time_bucket(time_to_seconds(time) if isinstance(time, str) else time)
+        svg_key = heatmap_cache_key(find_start_stop(connections, start), start_time, service_date, algorithm,
+                                    max_transfers, window_minutes, max_travel_time, arrive_by, modes,
+                                    time_field=time_field)
+        if cache.get_file(svg_key, HEATMAP_SVG_PATH):
+            print(f"result cache: {cache.stats()}")
+            return
+    starting_algorithm(connections, start, time, service_date, calendar, algorithm, max_transfers, window_minutes,
+                       max_travel_time, arrive_by, modes)
+    if cache is not None:
+        print(f"result cache: {cache.stats()}")
+    run_heatmap(time_field)
+    if svg_key is not None:
+        cache.put_file(svg_key, HEATMAP_SVG_PATH)
 
-def run_heatmap():
-    subprocess.run(["python", "generate_heatmap.py"], check=True)
+def run_heatmap(time_field="travel_time"):
+    # time_field: travel_time, or min/median/p90_travel_time after a window query
+    subprocess.run(["python", "generate_heatmap.py", time_field], check=True)
 
 def load_data():
-    return load_connections(CONNCECTIONS_PATH)
+    # The memory-mapped binary graph starts much faster; the JSON file is the fallback
+    if os.path.isdir(GRAPH_PATH):
+        connections = load_binary_graph(GRAPH_PATH).connections()
+        # Built from the graph arrays, no stop is materialized; load_connections builds the index itself
+        stop_index(connections)
+    else:
+        connections = load_connections(CONNCECTIONS_PATH)
+        with open(CONNCECTIONS_PATH, 'rb') as f:
+            _loaded_versions[id(connections)] = hashlib.sha256(f.read()).hexdigest()
+    set_result_cache(ResultCache(RESULT_CACHE_PATH, data_version(connections)))
+    if MINUTE_TABLE_MIN_DEPARTURES is not None:
+        enable_minute_tables(MINUTE_TABLE_MIN_DEPARTURES, MINUTE_TABLE_BUDGET_MB * 2 ** 20)
+        report = report_minute_tables(connections)
+        if report is not None and report['table_us'] >= report['search_us']:
+            disable_minute_tables()
+            cached_raptor(connections).minute_tables = None
+            print("minute tables: not faster than the binary search, turned off")
+    return connections
+
+def report_minute_tables(connections):
+    """
+    Builds the tables of the configured engine at startup and prints what they cost and save; returns
+    the router's minute_table_report (None for Dijkstra, whose lookups are not timed, or without tables).
+    """
+    if ROUTING_ALGORITHM == "dijkstra":
+        tables, size = dijkstra_minute_tables(connections)
+        print(f"minute tables: {tables} lines, {size / 2 ** 20:.1f} MB")
+        return None
+    report = cached_raptor(connections).minute_table_report()
+    if report is None:
+        print("minute tables: no line above the threshold")
+        return None
+    print(f"minute tables: {report['lines']} lines ({report['share_of_departures']:.0%} of departures), "
+          f"{report['megabytes']:.1f} MB, next departure {report['table_us']:.3f} us instead of "
+          f"{report['search_us']:.3f} us")
+    return report
+
+# Content hash of connections loaded from JSON (a binary graph carries its own in meta.json)
+_loaded_versions = {}
+
+def data_version(connections):
+    """Version of the routing data: graph content hash plus the state of the real-time delays file."""
+    if isinstance(connections, ConnectionsView):
+        version = connections.graph.meta.get('content_hash', '')
+    else:
+        version = _loaded_versions.get(id(connections), '')
+    if os.path.exists(DELAYS_PATH):
+        delays = os.stat(DELAYS_PATH)
+        version += f"/{delays.st_size}/{delays.st_mtime_ns}"
+    return hashlib.sha256(version.encode('utf-8')).hexdigest()[:16]
+
+def load_calendar_data():
+    # Without a calendar every departure is treated as running every day
+    if os.path.exists(CALENDAR_PATH):
+        return load_calendar(CALENDAR_PATH)
+    return None
 
 if __name__ == "__main__":
     run_algorithm()
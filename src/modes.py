@@ -0,0 +1,54 @@
+# Every line carries one mode bit and one operator bit; a mode mask is any combination of them and
+# a line may be used when both of its bits are in the mask (see mode_mask)
+MODES = ('bus', 'tram', 'train', 'ferry')
+OPERATORS = ('ztm', 'zkm', 'skm', 'mzkw', 'other')
+MODE_BITS = {mode: 1 << index for index, mode in enumerate(MODES)}
+OPERATOR_BITS = {operator: 1 << (len(MODES) + index) for index, operator in enumerate(OPERATORS)}
+
+# Lines of feeds without routes.txt get the usual mode of their operator
+OPERATOR_DEFAULT_MODES = {'skm': 'train'}
+
+
+def route_type_mode(route_type):
+    """Mode of a GTFS route_type, basic (0-12) or extended (100-1700); None when unknown."""
+    if route_type is None:
+        return None
+    route_type = int(route_type)
+    if route_type in (0, 5) or 900 <= route_type < 1000:
+        return 'tram'
+    if route_type in (1, 2, 12) or 100 <= route_type < 200 or 400 <= route_type < 500:
+        return 'train'
+    if route_type == 4 or 1000 <= route_type < 1300:
+        return 'ferry'
+    return 'bus'
+
+
+def line_operator(line_id):
+    """Operator prefix of a merged line id ('ztm:54' -> 'ztm')."""
+    operator = str(line_id).split(':', 1)[0] if ':' in str(line_id) else None
+    return operator if operator in OPERATOR_BITS else 'other'
+
+
+def line_mode_bits(line_id, route_type=None):
+    operator = line_operator(line_id)
+    mode = route_type_mode(route_type) or OPERATOR_DEFAULT_MODES.get(operator, 'bus')
+    return MODE_BITS[mode] | OPERATOR_BITS[operator]
+
+
+def mode_mask(modes=None, operators=None):
+    """
+    Mask of the given modes (e.g. ['bus', 'tram']) and operators (e.g. everything but 'mzkw');
+    None stands for all of them. Raises ValueError for unknown names.
+    """
+    unknown = set(modes or ()) - set(MODE_BITS) | set(operators or ()) - set(OPERATOR_BITS)
+    if unknown:
+        raise ValueError(f"Unknown modes or operators: {', '.join(sorted(unknown))}")
+    mode_bits = sum(MODE_BITS.values()) if modes is None else sum(MODE_BITS[mode] for mode in set(modes))
+    operator_bits = (sum(OPERATOR_BITS.values()) if operators is None
+                     else sum(OPERATOR_BITS[operator] for operator in set(operators)))
+    return mode_bits | operator_bits
+
+
+def line_allowed(line_bits, modes):
+    """modes: a mode mask or None (every line)."""
+    return modes is None or line_bits & modes == line_bits
@@ -0,0 +1,31 @@
+from collections import OrderedDict
+
+
+class ObjectCache:
+    """
+    Small LRU of values derived from objects in memory (routers of a connections object, date
+    partitions, ...), keyed by the identity of those objects plus plain hashable values. The objects
+    are kept in their entry, so their id() cannot be reused by another object while it exists,
+    and only the maxsize most recently used entries are kept.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+
+    def get(self, objects, build, key=()):
+        """The value for objects (a tuple) and key, built with build() when it is not cached."""
+        full_key = tuple(id(value) for value in objects) + tuple(key)
+        entry = self.entries.get(full_key)
+        if entry is not None and all(cached is value for cached, value in zip(entry[0], objects)):
+            self.entries.move_to_end(full_key)
+            return entry[1]
+        value = build()
+        self.entries[full_key] = (objects, value)
+        self.entries.move_to_end(full_key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        self.entries.clear()
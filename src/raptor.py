@@ -0,0 +1,467 @@
+import time
+import numpy as np
+from binary_graph import ConnectionsView, build_binary_graph
+from footpaths import project_coordinates, relax_transfers, stop_limit
+import timetable
+from object_cache import ObjectCache
+
+UNREACHABLE = np.iinfo(np.int64).max
+# Predecessor line of a stop reached on foot, and of a stop not improved in that round
+WALK = -1
+NO_PREDECESSOR = -2
+
+
+class Raptor:
+    """
+    Round-based router (RAPTOR) over the arrays of a BinaryGraph. A route is a line leaving a
+    stop together with its to_stations and its trips are the line's departure times, so round k
+    holds the earliest arrivals using at most k vehicles, i.e. k - 1 transfers.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.stop_names = graph.stop_names
+        self.stop_index = graph.stop_index
+        self.stop_line_offsets = np.asarray(graph.stop_line_offsets, dtype=np.int64)
+        self.line_count = len(graph.line_key)
+        self.line_departure_offsets = np.asarray(graph.line_departure_offsets, dtype=np.int64)
+        self.line_edge_offsets = np.asarray(graph.line_edge_offsets, dtype=np.int64)
+        self.edge_stop = np.asarray(graph.edge_stop, dtype=np.int64)
+        self.edge_seconds = np.asarray(graph.edge_seconds, dtype=np.int64)
+        self.departure_times = np.asarray(graph.departure_times, dtype=np.int64)
+        self.transfer_offsets = np.asarray(graph.transfer_offsets, dtype=np.int64)
+        self.transfer_stop = np.asarray(graph.transfer_stop, dtype=np.int64)
+        self.transfer_seconds = np.asarray(graph.transfer_seconds, dtype=np.int64)
+        self.line_modes = np.asarray(graph.line_modes, dtype=np.int64)
+        self._allowed = {}
+        # Departures of a line are sorted, so (line, time) keys are sorted over the whole array
+        # and the first trip of every scanned route is found with a single searchsorted
+        departure_line = np.repeat(np.arange(self.line_count, dtype=np.int64), np.diff(self.line_departure_offsets))
+        self.departure_keys = (departure_line << 32) | self.departure_times
+        # O(1) lookups on the busiest lines instead of the searchsorted, see timetable.enable_minute_tables
+        options = timetable.minute_table_options
+        self.minute_tables = None if options is None else timetable.MinuteTables(
+            self.line_departure_offsets, self.departure_times, **options)
+        # Reversed index for arrive-by searches: the edges arriving at every stop, grouped by that stop
+        self.line_stop = np.repeat(np.arange(len(self.stop_names), dtype=np.int64), np.diff(self.stop_line_offsets))
+        self.edge_line = np.repeat(np.arange(self.line_count, dtype=np.int64), np.diff(self.line_edge_offsets))
+        self.incoming_edges = np.argsort(self.edge_stop, kind='stable')
+        self.incoming_offsets = np.concatenate(
+            ([0], np.cumsum(np.bincount(self.edge_stop, minlength=len(self.stop_names))))).astype(np.int64)
+        # Straight-line lower bounds for single-destination queries, see lower_bounds
+        self.stop_points = project_coordinates(np.asarray(graph.coord_lat)[np.asarray(graph.coord_offsets[:-1])],
+                                               np.asarray(graph.coord_lon)[np.asarray(graph.coord_offsets[:-1])])
+        self.top_speed = self._top_speed()
+
+    def _top_speed(self):
+        """
+        Highest straight-line speed (metres per second between the first coordinates of two stops) of any
+        edge or footpath, so no journey covers a distance faster. Infinite when some edge takes 0 seconds
+        between different points, or when no edge leaves its point (a speed of 0 would divide 0 by 0);
+        lower bounds are then 0 everywhere.
+        """
+        transfer_from = np.repeat(np.arange(len(self.stop_names)), np.diff(self.transfer_offsets))
+        origins = np.concatenate((self.line_stop[self.edge_line], transfer_from))
+        targets = np.concatenate((self.edge_stop, self.transfer_stop))
+        seconds = np.concatenate((self.edge_seconds, self.transfer_seconds))
+        distances = np.linalg.norm(self.stop_points[origins] - self.stop_points[targets], axis=1)
+        if ((seconds <= 0) & (distances > 0)).any():
+            return np.inf
+        moving = (seconds > 0) & (distances > 0)
+        return float((distances[moving] / seconds[moving]).max()) if moving.any() else np.inf
+
+    def lower_bounds(self, target):
+        """Seconds needed from every stop to target at top_speed in a straight line; never above the real time."""
+        distances = np.linalg.norm(self.stop_points - self.stop_points[self.stop_index[target]], axis=1)
+        # Slightly below the exact quotient, so rounding never makes a bound too high
+        return np.floor(distances / self.top_speed * (1 - 1e-9)).astype(np.int64)
+
+    def allowed_lines(self, modes):
+        """Boolean mask of the lines inside the mode mask modes (modes.mode_mask), None for every line."""
+        if modes is None:
+            return None
+        if modes not in self._allowed:
+            self._allowed[modes] = (self.line_modes & modes) == self.line_modes
+        return self._allowed[modes]
+
+    def _next_trips(self, lines, clocks):
+        """Index of the first departure at or after clocks on every line, the end of the line's range if there is none."""
+        if self.minute_tables is None:
+            return np.searchsorted(self.departure_keys, (lines << 32) | clocks)
+        covered = self.minute_tables.covers(lines)
+        trips = np.empty(len(lines), dtype=np.int64)
+        trips[covered] = self.minute_tables.next_departures(lines[covered], clocks[covered])
+        trips[~covered] = np.searchsorted(self.departure_keys, (lines[~covered] << 32) | clocks[~covered])
+        return trips
+
+    def minute_table_report(self, samples=100000, seed=0):
+        """
+        Memory of the minute tables and the time of one next-departure lookup on the lines they cover,
+        through the tables and through the binary search they replace (microseconds).
+        """
+        tables = self.minute_tables
+        if tables is None or not tables.line_count:
+            return None
+        rng = np.random.default_rng(seed)
+        # Sorted like the lines of a route scan
+        lines = np.sort(rng.choice(np.flatnonzero(tables.covers(np.arange(self.line_count))), samples))
+        clocks = rng.integers(0, self.departure_times.max(initial=0) + 1, samples)
+        timings = {}
+        for name, lookup in (('table', tables.next_departures),
+                             ('search', lambda lines, clocks: np.searchsorted(self.departure_keys, (lines << 32) | clocks))):
+            started = time.perf_counter()
+            lookup(lines, clocks)
+            timings[name] = (time.perf_counter() - started) / samples * 1e6
+        return {'lines': tables.line_count, 'departures': tables.departure_count,
+                'share_of_departures': tables.departure_count / max(len(self.departure_times), 1),
+                'megabytes': tables.nbytes / 2 ** 20,
+                'table_us': timings['table'], 'search_us': timings['search']}
+
+    def _routes_of(self, stops):
+        counts = np.diff(self.stop_line_offsets)[stops]
+        first_line = np.repeat(self.stop_line_offsets[stops] - (np.cumsum(counts) - counts), counts)
+        return np.repeat(stops, counts), first_line + np.arange(counts.sum())
+
+    def _scan_routes(self, marked, boarding, current, limit=UNREACHABLE - 1, predecessors=None, allowed=None):
+        """
+        Boards every line at the marked stops at boarding[stop]; improves current in place up to the limit clock.
+        predecessors, when given, is the (stop, line, departure) label triple of this round, filled for
+        every stop improved (see journey); allowed (see allowed_lines) leaves out the other lines.
+        """
+        board_stop, lines = self._routes_of(marked)
+        if allowed is not None:
+            usable = allowed[lines]
+            board_stop, lines = board_stop[usable], lines[usable]
+        trip = self._next_trips(lines, boarding[board_stop])
+        caught = trip < self.line_departure_offsets[lines + 1]
+        lines, trip = lines[caught], trip[caught]
+
+        counts = self.line_edge_offsets[lines + 1] - self.line_edge_offsets[lines]
+        first_edge = np.repeat(self.line_edge_offsets[lines] - (np.cumsum(counts) - counts), counts)
+        edges = first_edge + np.arange(counts.sum())
+        arrivals = np.repeat(self.departure_times[trip], counts) + self.edge_seconds[edges]
+        targets = self.edge_stop[edges]
+        better = (arrivals < current[targets]) & (arrivals <= stop_limit(limit, targets))
+        np.minimum.at(current, targets[better], arrivals[better])
+        if predecessors is not None:
+            # Of several equally good candidates any one is a valid predecessor
+            won = better & (arrivals == current[targets])
+            predecessor_stop, predecessor_line, predecessor_departure = predecessors
+            predecessor_stop[targets[won]] = np.repeat(board_stop[caught], counts)[won]
+            predecessor_line[targets[won]] = np.repeat(lines, counts)[won]
+            predecessor_departure[targets[won]] = np.repeat(self.departure_times[trip], counts)[won]
+        # Footpaths from the stops reached in this round belong to the same round
+        self._walk(current, np.unique(targets[better]), limit, predecessors)
+
+    def _scan_routes_backward(self, marked, alighting, current, limit=UNREACHABLE - 1, allowed=None):
+        """
+        Reverse of _scan_routes with negated clocks: -alighting[stop] is the latest arrival allowed at a
+        marked stop; takes the latest departure of every line arriving there in time and lowers current
+        (negated latest departures) at the stops those lines leave from, up to the negated limit.
+        """
+        counts = self.incoming_offsets[marked + 1] - self.incoming_offsets[marked]
+        first = np.repeat(self.incoming_offsets[marked] - (np.cumsum(counts) - counts), counts)
+        edges = self.incoming_edges[first + np.arange(counts.sum())]
+        # Only the latest time a line may leave its stop matters, so the edges are reduced to one
+        # search per line (in line order, which keeps searchsorted cache-friendly)
+        deadlines = np.full(self.line_count, UNREACHABLE, dtype=np.int64)
+        np.minimum.at(deadlines, self.edge_line[edges], np.repeat(alighting[marked], counts) + self.edge_seconds[edges])
+        lines = np.flatnonzero(deadlines != UNREACHABLE if allowed is None else (deadlines != UNREACHABLE) & allowed)
+        # The latest departure is the one before the first departure after the deadline; times before
+        # the start of the day match no departure
+        trip = self._next_trips(lines, np.maximum(-deadlines[lines], -1) + 1) - 1
+        caught = trip >= self.line_departure_offsets[lines]
+        departures = -self.departure_times[trip[caught]]
+        sources = self.line_stop[lines[caught]]
+        better = (departures < current[sources]) & (departures <= limit)
+        np.minimum.at(current, sources[better], departures[better])
+        # Footpaths are symmetric, so walking backwards is the same relaxation on negated clocks
+        self._walk(current, np.unique(sources[better]), limit)
+
+    def _walk(self, current, improved, limit, predecessors=None):
+        if predecessors is None:
+            relax_transfers(current, improved, self.transfer_offsets, self.transfer_stop, self.transfer_seconds, limit)
+            return
+        walked = relax_transfers(current, improved, self.transfer_offsets, self.transfer_stop, self.transfer_seconds,
+                                 limit, walked_from=predecessors[0])
+        predecessors[1][walked] = WALK
+
+    def _round_predecessors(self):
+        return (np.full(len(self.stop_names), -1, dtype=np.int64),
+                np.full(len(self.stop_names), NO_PREDECESSOR, dtype=np.int64),
+                np.zeros(len(self.stop_names), dtype=np.int64))
+
+    def rounds(self, start, departure_time, max_transfers=None, max_travel_time=None, predecessors=None,
+               target=None, modes=None):
+        """
+        Earliest arrival clock at every stop after each round: row k uses at most k vehicles
+        (row 0 is the origin only). Unreachable stops, and stops reached only after more than
+        max_travel_time seconds, are UNREACHABLE. Without max_transfers the rounds continue until
+        no stop improves. A predecessors list gets one (stop, line, departure) label triple per round.
+        With a target only its column is exact: labels that cannot beat the target's best arrival
+        even with the lower_bounds are neither stored nor extended, and the rounds end as soon as
+        no label can improve the target any more. Only lines inside the mode mask modes are boarded.
+        """
+        allowed = self.allowed_lines(modes)
+        limit = UNREACHABLE - 1 if max_travel_time is None else departure_time + max_travel_time
+        current = np.full(len(self.stop_names), UNREACHABLE, dtype=np.int64)
+        current[self.stop_index[start]] = departure_time
+        labels = None
+        if predecessors is not None:
+            labels = self._round_predecessors()
+            predecessors.append(labels)
+        # Round 0: the origin and the stops within walking distance of it
+        self._walk(current, np.array([self.stop_index[start]]), limit, labels)
+        marked = np.flatnonzero(current != UNREACHABLE)
+        result = [current]
+        max_rounds = None if max_transfers is None else max_transfers + 1
+        round_limit = limit
+        if target is not None:
+            target_stop, bounds = self.stop_index[target], self.lower_bounds(target)
+
+        while max_rounds is None or len(result) <= max_rounds:
+            if target is not None:
+                # Only labels that could still arrive before the target's current best are useful
+                best = current[target_stop]
+                marked = marked[current[marked] + bounds[marked] < best]
+                round_limit = np.minimum(limit, best - 1 - bounds)
+            if not len(marked):
+                break
+            previous = current
+            current = previous.copy()
+            if predecessors is not None:
+                labels = self._round_predecessors()
+                predecessors.append(labels)
+            self._scan_routes(marked, previous, current, round_limit, labels, allowed)
+            marked = np.flatnonzero(current < previous)
+            result.append(current)
+
+        return np.vstack(result)
+
+    def travel_time(self, start, target, departure_time, max_transfers=None, max_travel_time=None, modes=None):
+        """Seconds from departure_time to the earliest arrival at target (inf when unreachable), target-pruned."""
+        arrival = int(self.rounds(start, departure_time, max_transfers, max_travel_time, target=target, modes=modes)[
+            -1, self.stop_index[target]])
+        return float('inf') if arrival == UNREACHABLE else arrival - departure_time
+
+    def journey(self, start, target, departure_time, max_transfers=None, max_travel_time=None, modes=None):
+        """
+        Legs of an earliest-arrival journey from start to target, rebuilt from the predecessor labels
+        of the rounds (three flat arrays per round, so memory does not depend on the path lengths):
+        a list of {'line' (None when walking), 'from_stop', 'to_stop', 'departure', 'arrival'} with
+        clocks in seconds, [] when start is target and None when target is unreachable.
+        """
+        predecessors = []
+        rows = self.rounds(start, departure_time, max_transfers, max_travel_time, predecessors, target, modes)
+        stop, round_index = self.stop_index[target], len(rows) - 1
+        if rows[round_index, stop] == UNREACHABLE:
+            return None
+
+        legs = []
+        while True:
+            predecessor_stop, predecessor_line, predecessor_departure = predecessors[round_index]
+            line = int(predecessor_line[stop])
+            if line == NO_PREDECESSOR:
+                # Not improved in this round: the label comes from an earlier one (the origin in round 0)
+                if round_index == 0:
+                    break
+                round_index -= 1
+                continue
+            previous_stop, arrival = int(predecessor_stop[stop]), int(rows[round_index, stop])
+            if line == WALK:
+                transfer_stops, walking_times = self.graph.transfers(previous_stop)
+                departure = arrival - int(walking_times[np.flatnonzero(transfer_stops == stop)[0]])
+            else:
+                departure = int(predecessor_departure[stop])
+                # The vehicle was boarded with the label of the previous round
+                round_index -= 1
+            legs.append({'line': None if line == WALK else self.graph.string(self.graph.line_key[line]),
+                         'from_stop': self.stop_names[previous_stop], 'to_stop': self.stop_names[stop],
+                         'departure': departure, 'arrival': arrival})
+            stop = previous_stop
+        return legs[::-1]
+
+    def reverse_rounds(self, target, arrival_time, max_transfers=None, max_travel_time=None, modes=None):
+        """
+        Arrive-by counterpart of rounds: row k holds the negated latest departure clock from every stop
+        that reaches target by arrival_time using at most k vehicles (UNREACHABLE when none does, or when
+        it means leaving more than max_travel_time seconds before arrival_time).
+        """
+        allowed = self.allowed_lines(modes)
+        limit = UNREACHABLE - 1 if max_travel_time is None else max_travel_time - arrival_time
+        current = np.full(len(self.stop_names), UNREACHABLE, dtype=np.int64)
+        current[self.stop_index[target]] = -arrival_time
+        self._walk(current, np.array([self.stop_index[target]]), limit)
+        marked = np.flatnonzero(current != UNREACHABLE)
+        result = [current]
+        max_rounds = None if max_transfers is None else max_transfers + 1
+
+        while len(marked) and (max_rounds is None or len(result) <= max_rounds):
+            previous = current
+            current = previous.copy()
+            self._scan_routes_backward(marked, previous, current, limit, allowed)
+            marked = np.flatnonzero(current < previous)
+            result.append(current)
+
+        return np.vstack(result)
+
+    def walking_times(self, start, max_travel_time=None):
+        """Seconds needed to walk from start to every stop (0 at start, UNREACHABLE beyond the footpaths)."""
+        walking = np.full(len(self.stop_names), UNREACHABLE, dtype=np.int64)
+        walking[self.stop_index[start]] = 0
+        self._walk(walking, np.array([self.stop_index[start]]), UNREACHABLE - 1 if max_travel_time is None
+                   else max_travel_time)
+        return walking
+
+    def origin_departures(self, walking, allowed=None):
+        """
+        Times at which one has to leave the origin to catch a departure (of an allowed line), from the origin
+        itself or from a stop within walking distance (departure minus walking time), as sorted (times, stops) pairs.
+        """
+        times, stops = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        for stop in np.flatnonzero(walking != UNREACHABLE).tolist():
+            lines = np.arange(self.stop_line_offsets[stop], self.stop_line_offsets[stop + 1])
+            if allowed is not None:
+                lines = lines[allowed[lines]]
+            counts = self.line_departure_offsets[lines + 1] - self.line_departure_offsets[lines]
+            departures = np.repeat(self.line_departure_offsets[lines] - (np.cumsum(counts) - counts), counts)
+            times.append(self.departure_times[departures + np.arange(counts.sum())] - walking[stop])
+            stops.append(np.full(counts.sum(), stop, dtype=np.int64))
+        times, stops = np.concatenate(times), np.concatenate(stops)
+        order = np.lexsort((stops, times))
+        return times[order], stops[order]
+
+    def profile(self, start, window_start, window_end, max_transfers=None, max_travel_time=None, modes=None):
+        """
+        rRAPTOR: earliest arrivals for every origin departure (see origin_departures) in
+        [window_start, window_end] plus the first one after the window. Departures are processed from
+        the latest one and each run starts from the round labels of the previous (later) run, which stay
+        valid upper bounds, so a run only scans routes from the stops whose departure it adds and
+        whatever that improves.
+        Returns (departures, arrivals, walking) with arrivals[i] the earliest arrival clocks when leaving
+        at departures[i] and walking the walking times from start; with max_travel_time, arrivals later
+        than that after departures[i] are not guaranteed to be earliest.
+        """
+        allowed = self.allowed_lines(modes)
+        walking = self.walking_times(start, max_travel_time)
+        times, stops = self.origin_departures(walking, allowed)
+        # Everything from window_start up to and including the first departure time after the window
+        first, last = np.searchsorted(times, window_start), np.searchsorted(times, window_end)
+        if last < len(times):
+            last = np.searchsorted(times, times[last], side='right')
+        times, stops = times[first:last], stops[first:last]
+        departures, run_starts = np.unique(times, return_index=True)
+        run_ends = np.append(run_starts[1:], len(times))
+        max_rounds = None if max_transfers is None else max_transfers + 1
+
+        labels = [np.full(len(self.stop_names), UNREACHABLE, dtype=np.int64)]
+        arrivals = []
+        for run in range(len(departures) - 1, -1, -1):
+            departure_time = int(departures[run])
+            limit = UNREACHABLE - 1 if max_travel_time is None else departure_time + max_travel_time
+            origin_row = np.where(walking == UNREACHABLE, UNREACHABLE, walking + departure_time)
+            rows = [origin_row]
+            if run == len(departures) - 1:
+                marked = np.flatnonzero(origin_row != UNREACHABLE)
+            else:
+                # Other stops within walking distance have no departure between this run and the next one,
+                # so boarding there now catches the same trips the later runs already scanned
+                marked = np.unique(stops[run_starts[run]:run_ends[run]])
+            while len(marked) and (max_rounds is None or len(rows) <= max_rounds):
+                initial = np.minimum(labels[min(len(rows), len(labels) - 1)], rows[-1])
+                current = initial.copy()
+                self._scan_routes(marked, rows[-1], current, limit, allowed=allowed)
+                marked = np.flatnonzero(current < initial)
+                rows.append(current)
+            # Rounds not reached in this run keep the labels of the later run
+            rows.extend(np.minimum(row, rows[-1]) for row in labels[len(rows):])
+            labels = rows
+            arrivals.append(rows[-1])
+
+        if not arrivals:
+            return departures, np.zeros((0, len(self.stop_names)), dtype=np.int64), walking
+        return departures, np.vstack(arrivals[::-1]), walking
+
+    def profile_travel_times(self, start, window_start, window_end, max_transfers=None, max_travel_time=None, step=60,
+                             modes=None):
+        """Travel time in seconds (inf when unreachable) for every start time in the window, one row per step."""
+        departures, arrivals, walking = self.profile(start, window_start, window_end, max_transfers, max_travel_time,
+                                                     modes)
+        start_times = np.arange(window_start, window_end, step, dtype=np.int64)
+        # Any journey using a vehicle is also possible when leaving at the next origin departure;
+        # the stops within walking distance are additionally reachable right away
+        next_departure = np.searchsorted(departures, start_times)
+        travel_times = np.full((len(start_times), len(self.stop_names)), np.inf)
+        has_departure = next_departure < len(departures)
+        clocks = arrivals[next_departure[has_departure]]
+        travel_times[has_departure] = np.where(clocks == UNREACHABLE, np.inf,
+                                               clocks - start_times[has_departure, None])
+        travel_times = np.minimum(travel_times, np.where(walking == UNREACHABLE, np.inf, walking))
+        if max_travel_time is not None:
+            travel_times[travel_times > max_travel_time] = np.inf
+        return travel_times
+
+    def all_times(self, start, departure_time, max_transfers=None, max_travel_time=None, modes=None):
+        """Same layout as algorithm.dijkstra_all_times, limited to max_transfers transfers."""
+        earliest = self.rounds(start, departure_time, max_transfers, max_travel_time, modes=modes)[-1].tolist()
+        return {name: float('inf') if arrival == UNREACHABLE else arrival - departure_time
+                for name, arrival in zip(self.stop_names, earliest)}
+
+    def arrive_by_times(self, target, arrival_time, max_transfers=None, max_travel_time=None, modes=None):
+        """
+        {stop: seconds between the latest departure from stop that still reaches target by arrival_time
+        and arrival_time, or inf}: the same layout as all_times, so the result is drawn the same way.
+        """
+        latest = self.reverse_rounds(target, arrival_time, max_transfers, max_travel_time, modes)[-1].tolist()
+        return {name: float('inf') if departure == UNREACHABLE else arrival_time + departure
+                for name, departure in zip(self.stop_names, latest)}
+
+
+def build_raptor(connections):
+    """Builds the router from a binary graph view or the output of load_connections."""
+    if isinstance(connections, ConnectionsView):
+        return Raptor(connections.graph)
+    return Raptor(build_binary_graph(connections))
+
+
+# Router arrays of the last few connections objects (a loaded graph or one of its date partitions)
+ROUTER_CACHE_SIZE = 4
+_routers = ObjectCache(ROUTER_CACHE_SIZE)
+
+
+def cached_raptor(connections):
+    return _routers.get((connections,), lambda: build_raptor(connections))
+
+
+def raptor_all_times(connections, start, departure_time, max_transfers=None, max_travel_time=None, modes=None):
+    return cached_raptor(connections).all_times(start, departure_time, max_transfers, max_travel_time, modes)
+
+
+def raptor_travel_time(connections, start, target, departure_time, max_transfers=None, max_travel_time=None,
+                       modes=None):
+    return cached_raptor(connections).travel_time(start, target, departure_time, max_transfers, max_travel_time,
+                                                  modes)
+
+
+def raptor_journey(connections, start, target, departure_time, max_transfers=None, max_travel_time=None, modes=None):
+    return cached_raptor(connections).journey(start, target, departure_time, max_transfers, max_travel_time, modes)
+
+
+def raptor_arrive_by_times(connections, target, arrival_time, max_transfers=None, max_travel_time=None, modes=None):
+    return cached_raptor(connections).arrive_by_times(target, arrival_time, max_transfers, max_travel_time, modes)
+
+
+def raptor_profile(connections, start, window_start, window_end, max_transfers=None, max_travel_time=None,
+                   modes=None):
+    """
+    Travel-time statistics over all start minutes of [window_start, window_end) in one rRAPTOR
+    sweep: {stop: {'min', 'median', 'p90'}} in seconds, inf when unreachable in that share of minutes.
+    """
+    router = cached_raptor(connections)
+    travel_times = router.profile_travel_times(start, window_start, window_end, max_transfers, max_travel_time,
+                                               modes=modes)
+    # Observed values only (no interpolation), so unreachable minutes give inf instead of nan
+    minimum = travel_times.min(axis=0).tolist()
+    median, p90 = np.percentile(travel_times, [50, 90], axis=0, method='higher').tolist()
+    return {name: {'min': minimum[stop], 'median': median[stop], 'p90': p90[stop]}
+            for stop, name in enumerate(router.stop_names)}
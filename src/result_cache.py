@@ -0,0 +1,102 @@
+import os
+import gzip
+import json
+import shutil
+import hashlib
+from collections import OrderedDict
+
+# Start times within one bucket share a result, computed for the start of the bucket
+TIME_BUCKET_SECONDS = 60
+
+
+def time_bucket(start_time):
+    return start_time - start_time % TIME_BUCKET_SECONDS
+
+
+class ResultCache:
+    """
+    Two-tier cache of heatmap results: an in-memory LRU in front of gzipped JSON files that survive
+    restarts. Entries live under the data version (graph content hash, real-time delays) they were
+    computed for; switching to another version drops the old entries from both tiers.
+    """
+
+    def __init__(self, directory, version, max_entries=256):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.file_hits = 0
+        self.version = None
+        self.set_version(version)
+
+    def set_version(self, version):
+        if version == self.version:
+            return
+        self.version = version
+        self.memory.clear()
+        if self.directory and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name != version:
+                    shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def key(self, origin, start_time, options):
+        """options: everything else the result depends on (engine, date, limits...), JSON-serializable."""
+        raw = json.dumps([origin, time_bucket(start_time), options], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key, suffix='.json.gz'):
+        return os.path.join(self.directory, self.version, f"{key}{suffix}")
+
+    def get(self, key):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return self.memory[key]
+        if self.directory and os.path.exists(self._path(key)):
+            with gzip.open(self._path(key), 'rt', encoding='utf-8') as f:
+                value = json.load(f)
+            self._remember(key, value)
+            self.hits += 1
+            self.disk_hits += 1
+            return value
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.directory:
+            os.makedirs(os.path.join(self.directory, self.version), exist_ok=True)
+            # Written next to the target and renamed, so a crash never leaves a truncated entry
+            temporary_path = self._path(key) + '.tmp'
+            with gzip.open(temporary_path, 'wt', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(temporary_path, self._path(key))
+
+    def get_file(self, key, target_path):
+        """Copies the file cached under key (e.g. a rendered heatmap) to target_path; False when there is none."""
+        path = self._path(key, '.file')
+        if not self.directory or not os.path.exists(path):
+            return False
+        shutil.copyfile(path, target_path)
+        self.file_hits += 1
+        return True
+
+    def put_file(self, key, source_path):
+        if not self.directory or not os.path.exists(source_path):
+            return
+        os.makedirs(os.path.join(self.directory, self.version), exist_ok=True)
+        temporary_path = self._path(key, '.file') + '.tmp'
+        shutil.copyfile(source_path, temporary_path)
+        os.replace(temporary_path, self._path(key, '.file'))
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def stats(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'file_hits': self.file_hits, 'misses': self.misses,
+                'memory_entries': len(self.memory), 'version': self.version}
@@ -4,16 +4,41 @@ import threading
 import json
 import os
 import sys
+from datetime import datetime
+from zoneinfo import ZoneInfo
 from find_nearest_stop import find_nearest_stop, load_stops
 from integration_algorithm import *
+from modes import mode_mask
+from generate_heatmap import TIME_FIELDS
 
 PORT = 8000
 stops = []
 connections = {}
+calendar = None
+WARSAW = ZoneInfo("Europe/Warsaw")
 
 REACT_SCRIPT_PATH = "../app"
 NPM_PATH = "..\\app\\node_modules\\.bin\\npm.cmd"
 
+def request_stop(stop):
+    # Nazwa przystanku routera; współrzędne z frontendu rozstrzygają, gdy ten sam stop_id ma kilku przewoźników
+    near = [stop["lat"], stop["lon"]] if stop.get("lat") is not None and stop.get("lon") is not None else None
+    return find_start_stop(connections, stop["id"], near)
+
+def request_date_time(data):
+    # Frontend wysyła dateTime z toISOString(), czyli w UTC; dzień rozkładu i godzina muszą być czasem lokalnym,
+    # inaczej np. 00:30 czasu polskiego trafia do rozkładu z poprzedniego dnia. Czas bez strefy jest już lokalny.
+    moment = datetime.fromisoformat(data["dateTime"].replace('Z', '+00:00'))
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(WARSAW)
+    return moment.date().isoformat(), moment.strftime('%H:%M:%S')
+
+def request_modes(data):
+    # Maska linii z pól "modes" i "operators" zapytania; None, gdy żadne nie jest podane (wszystkie linie)
+    if data.get("modes") is None and data.get("operators") is None:
+        return None
+    return mode_mask(data.get("modes"), data.get("operators"))
+
 class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
     
     def do_OPTIONS(self):
@@ -39,16 +64,75 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
                 self.wfile.write(json.dumps({"error": "Script not found"}).encode())
                 return
 
-            # Uruchamianie skryptu
+            stopData = data.get("startStop")
+            service_date, time = request_date_time(data)
+            # Opcjonalny limit przesiadek, np. mapa "dojazd z co najwyżej 1 przesiadką"
+            max_transfers = data.get("maxTransfers")
+            # Opcjonalne okno odjazdów w minutach i statystyka do narysowania (min, median, p90)
+            window_minutes = data.get("windowMinutes")
+            statistic = data.get("statistic", "median")
+            time_field = f"{statistic}_travel_time" if window_minutes else "travel_time"
+            # Zapytanie "dojazd na godzinę": przystanek jest celem, a dateTime godziną przyjazdu
+            arrive_by = bool(data.get("arriveBy", False))
+            # Opcjonalne środki transportu i przewoźnicy, np. ["bus", "tram"]; brak oznacza wszystkie
+            try:
+                modes = request_modes(data)
+                if f"{statistic}_travel_time" not in TIME_FIELDS:
+                    # Sprawdzane przed wyszukiwaniem, a nie dopiero w podprocesie rysującym mapę
+                    raise ValueError(f"Unknown statistic {statistic!r}, expected min, median or p90")
+                if arrive_by and window_minutes:
+                    # Okno odjazdów dotyczy godziny wyjazdu, więc nie łączy się z "dojazdem na godzinę"
+                    raise ValueError("arriveBy cannot be combined with windowMinutes")
+            except ValueError as e:
+                self.send_response(400)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(json.dumps({"error": str(e)}).encode())
+                return
+            # Uruchamianie skryptu; czasy powyżej skali mapy i tak są obcinane, więc wyszukiwanie kończy się na tej granicy
+            try:
+                run_algorithm(connections, request_stop(stopData), time, service_date, calendar,
+                              max_transfers=max_transfers, window_minutes=window_minutes, time_field=time_field,
+                              max_travel_time=MAX_DISPLAY_TIME * 60, arrive_by=arrive_by, modes=modes)
+            except UnknownOriginError as e:
+                # Nieznany przystanek: błąd zamiast pustej mapy
+                self.send_response(404)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(json.dumps({"error": str(e)}).encode())
+                return
+
             self.send_response(200)
             self.send_header("Content-Type", "application/json")
             self.end_headers()
-
-            stopData = data.get("startStop")
-            run_algorithm(connections, stopData["id"], data["dateTime"].split('T')[1].split('.')[0])
             self.wfile.write(json.dumps("OK").encode())
 
 
+        if self.path == "/get-journey":
+            # Trasa między dwoma przystankami z listą odcinków (linia lub przejście piesze)
+            content_length = int(self.headers['Content-Length'])
+            post_data = self.rfile.read(content_length)
+            data = json.loads(post_data.decode('utf-8'))
+            service_date, time = request_date_time(data)
+            try:
+                journey = plan_journey(connections, request_stop(data["startStop"]), request_stop(data["endStop"]),
+                                       time, service_date, calendar, max_transfers=data.get("maxTransfers"),
+                                       modes=request_modes(data))
+            except (UnknownOriginError, ValueError) as e:
+                self.send_response(404 if isinstance(e, UnknownOriginError) else 400)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.end_headers()
+                self.wfile.write(json.dumps({"error": str(e)}).encode())
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            # null, gdy do celu nie da się dojechać
+            self.wfile.write(json.dumps(journey, ensure_ascii=False).encode('utf-8'))
+
         if self.path == "/get-nearest-stop":
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length)
@@ -78,6 +162,7 @@ if __name__ == "__main__":
     server = HTTPServer(('localhost', PORT), SimpleHTTPRequestHandler)
     stops = load_stops()
     connections = load_data()
+    calendar = load_calendar_data()
 
     server_thread = threading.Thread(target = server.serve_forever)
     react_thread = threading.Thread(target = run_interface)
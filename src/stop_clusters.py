@@ -0,0 +1,92 @@
+import os
+import re
+import json
+import math
+from footpaths import project_coordinates
+from trip_patterns import is_pattern_data
+
+# Platforms of one stop ("Dworzec Główny 01", "Dworzec Główny 02") are merged into one router stop
+# when their names match without the platform number and they are at most CLUSTER_RADIUS metres
+# apart; stops of the same name further away (e.g. one street name in Gdańsk and in Gdynia) stay apart
+CLUSTER_RADIUS = 500  # metres
+CLUSTERS_FILE = 'stop_clusters.json'
+
+
+def base_stop_name(name):
+    """Stop name without the trailing platform number."""
+    return re.sub(r"\s+\d+$", "", name)
+
+
+def similarity_key(name):
+    return ' '.join(base_stop_name(name).split()).casefold()
+
+
+def build_stop_clusters(stops, radius=CLUSTER_RADIUS):
+    """
+    Cluster table {stop_id: router stop name} for stops given as (stop_id, stop_name, lat, lon).
+    Stops with the same similarity_key are linked when within radius metres (found on a grid of
+    radius-sized cells, so only neighbouring cells are compared) and every connected group becomes
+    one router stop. The first group of a name keeps the name without the platform number, the
+    following ones get " (2)", " (3)", ... appended.
+    """
+    stops = list(stops)
+    points = project_coordinates([lat for _, _, lat, _ in stops], [lon for _, _, _, lon in stops]).tolist()
+    keys = [similarity_key(name) for _, name, _, _ in stops]
+    parent = list(range(len(stops)))
+
+    def root(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    grid = {}
+    for index, (x, y) in enumerate(points):
+        cell = (keys[index], math.floor(x / radius), math.floor(y / radius))
+        for d_x in (-1, 0, 1):
+            for d_y in (-1, 0, 1):
+                for other in grid.get((cell[0], cell[1] + d_x, cell[2] + d_y), ()):
+                    if math.dist(points[index], points[other]) <= radius:
+                        parent[root(index)] = root(other)
+        grid.setdefault(cell, []).append(index)
+
+    # Names in the order of the first stop of every group, so the router keeps the order of the input
+    names, used = {}, set()
+    for index, (_, name, _, _) in enumerate(stops):
+        group = root(index)
+        if group not in names:
+            base, number = base_stop_name(name), 1
+            cluster_name = base
+            while cluster_name in used:
+                number += 1
+                cluster_name = f"{base} ({number})"
+            names[group] = cluster_name
+            used.add(cluster_name)
+    return {stop_id: names[root(index)] for index, (stop_id, _, _, _) in enumerate(stops)}
+
+
+def data_stops(data):
+    """(stop_id, stop_name, lat, lon) of a merged connections file (trip-pattern or to_stations layout)."""
+    stops = data['stops'] if is_pattern_data(data) else data
+    return [(stop_id, stop_data['stop_name'], stop_data['lat'], stop_data['lon']) for stop_id, stop_data in stops.items()]
+
+
+def clusters_path(json_file):
+    """The cluster table is stored next to the connections file it was built from."""
+    return os.path.join(os.path.dirname(os.path.abspath(json_file)), CLUSTERS_FILE)
+
+
+def connections_clusters(connections):
+    """The cluster table of merged connections: every stop_id mapped to the router stop it belongs to."""
+    return {str(stop_id): name for name, stop_data in connections.items() for stop_id in stop_data['stop_ids']}
+
+
+def save_stop_clusters(clusters, path, radius=CLUSTER_RADIUS):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'radius': radius, 'clusters': clusters}, f, ensure_ascii=False)
+
+
+def load_stop_clusters(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)['clusters']
+
@@ -0,0 +1,125 @@
+import re
+import math
+from binary_graph import ConnectionsView
+from trip_patterns import operator_local_id
+from object_cache import ObjectCache
+
+# Coordinates are matched within this many degrees, as the old linear scan did
+COORDINATE_TOLERANCE = 1e-5
+
+
+class UnknownOriginError(LookupError):
+    """The stop_id, coordinates or stop name of a query match no router stop."""
+
+    def __init__(self, query, kind):
+        super().__init__(f"Unknown {kind}: {query!r}")
+        self.query = query
+        self.kind = kind
+
+
+def cell(latitude, longitude):
+    return round(latitude / COORDINATE_TOLERANCE), round(longitude / COORDINATE_TOLERANCE)
+
+
+class StopIndex:
+    """
+    Hash indexes from the three kinds of origin queries to router stops (the merged stops keyed by name):
+    namespaced and operator-local stop_id, stop name and coordinates quantized to COORDINATE_TOLERANCE.
+    Where several stops match a name or coordinates, the first one in the order of the connections wins;
+    an operator-local stop_id used by several operators needs coordinates to choose between them.
+    """
+
+    def __init__(self, stops):
+        """stops: (stop name, stop_ids, latitudes, longitudes) of every router stop, in router order."""
+        self.names = {}
+        self.stop_ids = {}
+        self.local_ids = {}
+        self.cells = {}
+        self.coordinates = {}
+        for order, (stop_name, stop_ids, latitudes, longitudes) in enumerate(stops):
+            stop_name = str(stop_name)
+            self.names[stop_name] = stop_name
+            for stop_id in stop_ids:
+                self.stop_ids.setdefault(str(stop_id), stop_name)
+                candidates = self.local_ids.setdefault(operator_local_id(stop_id), [])
+                if stop_name not in candidates:
+                    candidates.append(stop_name)
+            self.coordinates[stop_name] = list(zip(latitudes, longitudes))
+            for latitude, longitude in zip(latitudes, longitudes):
+                self.cells.setdefault(cell(latitude, longitude), []).append((order, stop_name, latitude, longitude))
+
+    def by_stop_id(self, stop_id, near=None):
+        """
+        Namespaced ("ztm:1339") or the operator's own id (1339). When several operators use the same own id,
+        near ([latitude, longitude] sent with the query) picks the closest of their stops.
+        """
+        stop_id = str(stop_id)
+        if stop_id in self.stop_ids:
+            return self.stop_ids[stop_id]
+        candidates = self.local_ids.get(stop_id, [])
+        if len(candidates) == 1:
+            return candidates[0]
+        if not candidates:
+            raise UnknownOriginError(stop_id, "stop_id")
+        if near is not None:
+            distances = sorted((self.distance(stop_name, *near), stop_name) for stop_name in candidates)
+            if distances[0][0] < distances[1][0]:
+                return distances[0][1]
+        raise UnknownOriginError(stop_id, "stop_id shared by several operators, send coordinates or an operator-prefixed id")
+
+    def distance(self, stop_name, latitude, longitude):
+        """Approximate distance in degrees of latitude from the closest coordinates of stop_name."""
+        scale = math.cos(math.radians(latitude))
+        return min(math.hypot(lat - latitude, (lon - longitude) * scale) for lat, lon in self.coordinates[stop_name])
+
+    def by_coordinates(self, latitude, longitude):
+        # A point within the tolerance may fall into a neighbouring cell
+        row, column = cell(latitude, longitude)
+        matches = [(order, stop_name) for d_row in (-1, 0, 1) for d_column in (-1, 0, 1)
+                   for order, stop_name, lat, lon in self.cells.get((row + d_row, column + d_column), ())
+                   if abs(lat - latitude) < COORDINATE_TOLERANCE and abs(lon - longitude) < COORDINATE_TOLERANCE]
+        if not matches:
+            raise UnknownOriginError([latitude, longitude], "coordinates")
+        return min(matches)[1]
+
+    def by_name(self, name):
+        if name not in self.names:
+            raise UnknownOriginError(name, "stop name")
+        return self.names[name]
+
+    def resolve(self, query, near=None):
+        """Name of the router stop for a stop_id, [latitude, longitude] or stop name; near, see by_stop_id."""
+        if isinstance(query, int) or (isinstance(query, str) and re.fullmatch(r"(\w+:)?\d+", query)):
+            return self.by_stop_id(query, near)
+        if isinstance(query, list) and len(query) == 2 and all(isinstance(coord, (float, int)) for coord in query):
+            return self.by_coordinates(*query)
+        if isinstance(query, str):
+            return self.by_name(query)
+        raise UnknownOriginError(query, "origin query")
+
+
+def graph_stops(graph):
+    """The stops of a BinaryGraph read straight from its arrays, so no stop of a ConnectionsView is materialized."""
+    id_offsets, coord_offsets = graph.stop_id_offsets.tolist(), graph.coord_offsets.tolist()
+    stop_ids = [graph.string(index) for index in graph.stop_id_values.tolist()]
+    latitudes, longitudes = graph.coord_lat.tolist(), graph.coord_lon.tolist()
+    for stop, stop_name in enumerate(graph.stop_names):
+        coord_range = slice(coord_offsets[stop], coord_offsets[stop + 1])
+        yield (stop_name, stop_ids[id_offsets[stop]:id_offsets[stop + 1]],
+               latitudes[coord_range], longitudes[coord_range])
+
+
+def connections_stops(connections):
+    if isinstance(connections, ConnectionsView):
+        return graph_stops(connections.graph)
+    return ((stop_name, stop_data['stop_ids'], stop_data['latitudes'], stop_data['longitudes'])
+            for stop_name, stop_data in connections.items())
+
+
+# Indexes of the last few connections objects, like the router arrays
+STOP_INDEX_CACHE_SIZE = 4
+_stop_indexes = ObjectCache(STOP_INDEX_CACHE_SIZE)
+
+
+def stop_index(connections):
+    return _stop_indexes.get((connections,), lambda: StopIndex(connections_stops(connections)))
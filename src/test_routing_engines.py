@@ -0,0 +1,71 @@
+import os
+import json
+import random
+import tempfile
+import unittest
+from algorithm import load_connections
+from binary_graph import build_binary_graph
+from compare_routing_engines import compare, compare_arrive_by
+from modes import mode_mask
+
+
+def write_network(path, stop_count=40, line_count=12, trips_per_line=25, seed=3):
+    """
+    Random network in the to_stations layout of the old merged files: stops a few hundred metres
+    apart (so some are joined by footpaths), ZTM bus and SKM train lines, loops and trips past midnight.
+    Names must not end with a number, otherwise stop_clusters merges them as platforms of one stop.
+    """
+    rng = random.Random(seed)
+    stops = {
+        str(100 + index): {'stop_id': 100 + index, 'stop_name': f"Stop {index} Street",
+                           'lat': 54.35 + index % 8 * 0.003, 'lon': 18.60 + index // 8 * 0.004, 'connections': {}}
+        for index in range(stop_count)
+    }
+    stop_ids = list(stops)
+    for line in range(line_count):
+        line_id = f"{'skm' if line % 4 == 0 else 'ztm'}:{line}"
+        sequence = rng.sample(stop_ids, rng.randint(4, 10))
+        if line % 5 == 0:
+            sequence.append(sequence[0])
+        hops = [rng.randint(1, 4) * 60 + rng.choice((0, 30)) for _ in sequence]
+        offsets = [sum(hops[:position]) for position in range(len(sequence))]
+        starts = sorted(rng.randint(4 * 3600, 25 * 3600) for _ in range(trips_per_line))
+        for position, stop_id in enumerate(sequence[:-1]):
+            to_stations = {}
+            for next_position in range(position + 1, len(sequence)):
+                to_stations.setdefault(sequence[next_position], offsets[next_position] - offsets[position])
+            stops[stop_id]['connections'].setdefault(line_id, {
+                'departure_times': [start + offsets[position] for start in starts],
+                'to_stations': to_stations,
+            })
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(stops, f)
+
+
+class RoutingEnginesTest(unittest.TestCase):
+    """The checks of compare_routing_engines.py: every engine returns the reference Dijkstra's times."""
+
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'merged_connections.json')
+            write_network(path)
+            cls.connections = load_connections(path)
+        cls.graph = build_binary_graph(cls.connections).connections()
+
+    def test_engines_match_reference(self):
+        for label, connections in (('dictionary', self.connections), ('binary graph', self.graph)):
+            with self.subTest(label):
+                self.assertTrue(compare(connections, queries=15))
+
+    def test_engines_match_reference_with_cutoff_and_modes(self):
+        self.assertTrue(compare(self.graph, queries=15, max_travel_time=40 * 60))
+        self.assertTrue(compare(self.graph, queries=15, modes=mode_mask(operators=['ztm'])))
+
+    def test_arrive_by_matches_forward_searches(self):
+        self.assertTrue(compare_arrive_by(self.graph, queries=10))
+        self.assertTrue(compare_arrive_by(self.graph, queries=10, max_travel_time=40 * 60))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import numpy as np
+from array import array
+from bisect import bisect_left
+
+# Departures of a line are kept sorted in compact int32 arrays (seconds since the start of the
+# service day), so the next departure is a binary search instead of a scan over the whole list.
+
+
+def departure_array(times):
+    """Sorted, unique departure times as array('i')."""
+    return array('i', sorted(set(times)))
+
+
+def next_departure(departures, clock, table=None):
+    """
+    First departure at or after clock from a sorted sequence, None when the line has finished;
+    table is the line's minute_table, if it has one.
+    """
+    if table is not None:
+        return next_departure_in_table(departures, clock, table)
+    index = bisect_left(departures, clock)
+    return departures[index] if index < len(departures) else None
+
+
+def index_departures(line_data):
+    """Sorts departure_times of a line in place, keeping departure_services parallel to them."""
+    services = line_data.get('departure_services')
+    if services is None:
+        line_data['departure_times'] = departure_array(line_data['departure_times'])
+        return line_data
+    order = sorted(range(len(line_data['departure_times'])), key=line_data['departure_times'].__getitem__)
+    line_data['departure_times'] = array('i', [line_data['departure_times'][index] for index in order])
+    line_data['departure_services'] = [services[index] for index in order]
+    return line_data
+
+
+# Optional per-minute next-departure tables for the busiest lines (hub stops): entry m of a line's table
+# is the index of its first departure at or after minute m, so a lookup is one read plus a step over the
+# few departures of the same minute. Off until enable_minute_tables is called.
+MINUTE_TABLE_MIN_DEPARTURES = 100
+MINUTE_TABLE_MEMORY_BUDGET = 8 * 2 ** 20  # bytes per router (or per connections object for Dijkstra)
+minute_table_options = None
+
+
+def enable_minute_tables(min_departures=MINUTE_TABLE_MIN_DEPARTURES, memory_budget=MINUTE_TABLE_MEMORY_BUDGET):
+    """Routers and connections prepared from now on get tables for lines with at least min_departures departures."""
+    global minute_table_options
+    minute_table_options = {'min_departures': min_departures, 'memory_budget': memory_budget}
+
+
+def disable_minute_tables():
+    global minute_table_options
+    minute_table_options = None
+
+
+def table_lines(counts, sizes, min_departures, memory_budget):
+    """Lines (indices into counts) that get a table: the busiest first, as long as their sizes (bytes) fit the budget."""
+    candidates = np.flatnonzero(counts >= max(min_departures, 1))
+    candidates = candidates[np.argsort(-counts[candidates], kind='stable')]
+    return np.sort(candidates[np.cumsum(sizes[candidates]) <= memory_budget])
+
+
+def minute_table(departures):
+    """Table of a sorted departure sequence, one entry per minute up to the last departure plus len(departures)."""
+    typecode = 'H' if len(departures) < 2 ** 16 else 'I'
+    return array(typecode, [bisect_left(departures, minute * 60) for minute in range(departures[-1] // 60 + 2)])
+
+
+def next_departure_in_table(departures, clock, table):
+    """next_departure through a minute_table."""
+    index = table[min(clock // 60, len(table) - 1)]
+    while index < len(departures) and departures[index] < clock:
+        index += 1
+    return departures[index] if index < len(departures) else None
+
+
+def add_minute_tables(connections, min_departures=MINUTE_TABLE_MIN_DEPARTURES, memory_budget=MINUTE_TABLE_MEMORY_BUDGET):
+    """
+    Stores a minute_table in the busiest lines of a load_connections result (or ConnectionsView);
+    returns the number of tables and their size in bytes.
+    """
+    lines = [line_data for stop_data in connections.values() for line_data in stop_data['connections'].values()
+             if len(line_data['departure_times'])]
+    counts = np.array([len(line_data['departure_times']) for line_data in lines], dtype=np.int64)
+    sizes = np.array([(line_data['departure_times'][-1] // 60 + 2) * (2 if count < 2 ** 16 else 4)
+                      for line_data, count in zip(lines, counts.tolist())], dtype=np.int64)
+    chosen = table_lines(counts, sizes, min_departures, memory_budget)
+    for line in chosen.tolist():
+        lines[line]['minute_table'] = minute_table(lines[line]['departure_times'])
+    return len(chosen), int(sizes[chosen].sum())
+
+
+class MinuteTables:
+    """
+    Minute tables over the CSR departure arrays of a BinaryGraph (departure_times grouped by line through
+    line_departure_offsets), concatenated into one array; table_offsets is -1 for lines without a table.
+    """
+
+    def __init__(self, line_departure_offsets, departure_times, min_departures=MINUTE_TABLE_MIN_DEPARTURES,
+                 memory_budget=MINUTE_TABLE_MEMORY_BUDGET):
+        self.line_departure_offsets = line_departure_offsets
+        self.departure_times = departure_times
+        counts = np.diff(line_departure_offsets)
+        last = departure_times[np.maximum(line_departure_offsets[1:] - 1, 0)] if len(departure_times) else counts
+        entries = np.where(counts > 0, last // 60 + 2, 0)
+        dtype = np.uint16 if counts.max(initial=0) < 2 ** 16 else np.uint32
+        # The budget also pays for table_offsets
+        lines = table_lines(counts, entries * np.dtype(dtype).itemsize, min_departures, memory_budget - 8 * len(counts))
+
+        self.table_offsets = np.full(len(counts), -1, dtype=np.int64)
+        self.table_offsets[lines] = np.cumsum(entries[lines]) - entries[lines]
+        self.table_entries = entries
+        minutes = np.arange(entries.max(initial=0), dtype=np.int64) * 60
+        self.values = np.concatenate([np.zeros(0, dtype=dtype)] + [
+            np.searchsorted(departure_times[line_departure_offsets[line]:line_departure_offsets[line + 1]],
+                            minutes[:entries[line]]).astype(dtype)
+            for line in lines.tolist()])
+        self.line_count = len(lines)
+        self.departure_count = int(counts[lines].sum())
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.table_offsets.nbytes
+
+    def covers(self, lines):
+        return self.table_offsets[lines] >= 0
+
+    def next_departures(self, lines, clocks):
+        """Index into departure_times of the first departure at or after clocks on lines (all with a table), or the line end."""
+        minutes = np.minimum(clocks // 60, self.table_entries[lines] - 1)
+        trips = self.line_departure_offsets[lines] + self.values[self.table_offsets[lines] + minutes]
+        ends = self.line_departure_offsets[lines + 1]
+        # Departures earlier in the same minute than the clock
+        behind = np.flatnonzero(trips < ends)
+        behind = behind[self.departure_times[trips[behind]] < clocks[behind]]
+        while len(behind):
+            trips[behind] += 1
+            behind = behind[trips[behind] < ends[behind]]
+            behind = behind[self.departure_times[trips[behind]] < clocks[behind]]
+        return trips
@@ -0,0 +1,74 @@
+import json
+import hashlib
+
+# Trip-pattern layout of a connections file:
+#   patterns[pattern_id] = {'stops': [stop_id, ...], 'arrivals': [...], 'departures': [...]}
+#       one stop sequence of a trip, times in seconds after the departure from its first stop
+#   stops[stop_id]['connections'][line] = {'departure_times', ['departure_services'], 'pattern', 'position', ['next']}
+#       the line leaves stop_id at pattern['stops'][position]; the stops reachable from it start
+#       at index next (position + 1 unless the feed repeats a stop_sequence)
+# Pattern ids are content hashes, so shards of one feed can be merged with a plain dict update.
+
+
+def pattern_id(stops, arrivals, departures):
+    return hashlib.sha1(json.dumps([stops, arrivals, departures]).encode('utf-8')).hexdigest()[:16]
+
+
+def is_pattern_data(data):
+    return isinstance(data, dict) and set(data) == {'stops', 'patterns'}
+
+
+def pattern_to_stations(pattern, position, next_position=None):
+    """The old to_stations view: {stop_id: travel time in seconds} of every stop after position."""
+    start = position + 1 if next_position is None else next_position
+    departure = pattern['departures'][position]
+    return {stop_id: arrival - departure for stop_id, arrival in zip(pattern['stops'][start:], pattern['arrivals'][start:])}
+
+
+def pattern_segment(line_data, patterns):
+    """
+    (pattern, index of the first reachable stop, departure in seconds) of a line: its to_stations
+    without expanding them, as stored by the binary graph.
+    """
+    pattern = patterns[line_data['pattern']]
+    position = line_data['position']
+    next_position = line_data.get('next')
+    return pattern, position + 1 if next_position is None else next_position, pattern['departures'][position]
+
+
+def expand_line(line_data, patterns):
+    expanded = {'departure_times': line_data['departure_times']}
+    if 'departure_services' in line_data:
+        expanded['departure_services'] = line_data['departure_services']
+    expanded['to_stations'] = pattern_to_stations(patterns[line_data['pattern']], line_data['position'], line_data.get('next'))
+    if 'route_type' in line_data:
+        expanded['route_type'] = line_data['route_type']
+    return expanded
+
+
+def iter_expanded_stops(data):
+    """Yields (stop_id, stop_data) in the layout of the old *_connections_by_trips.json files."""
+    patterns = data['patterns']
+    for stop_id, stop_data in data['stops'].items():
+        yield stop_id, dict(stop_data, connections={
+            line_id: expand_line(line_data, patterns) for line_id, line_data in stop_data['connections'].items()
+        })
+
+
+def expand_patterns(data):
+    return dict(iter_expanded_stops(data))
+
+
+def drop_unused_patterns(data):
+    used = {line_data['pattern'] for stop_data in data['stops'].values() for line_data in stop_data['connections'].values()}
+    data['patterns'] = {key: pattern for key, pattern in data['patterns'].items() if key in used}
+    return data
+
+
+def namespaced_id(identifier, value):
+    """Stop, line and pattern ids of a merged file are prefixed with their operator, e.g. 'ztm:1234'."""
+    return f"{identifier}:{value}"
+
+
+def operator_local_id(value):
+    return str(value).split(':', 1)[-1]